@@ -1,17 +1,24 @@
 import argparse
+import itertools
+import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import date, datetime
 from pathlib import Path
-from typing import Literal
+from typing import TYPE_CHECKING, Literal
 
 import polars as pl
 import pymupdf
 from az_pmp_utils import tableau
 
+import cache
 from constants import PHX_TZ
 
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
 
 @dataclass
 class SearchParameters:
@@ -58,6 +65,65 @@ def parse_daterange(date_range: list) -> tuple[date, date]:
     return start_date, end_date
 
 
+@dataclass
+class ParsedPdf:
+    """
+    class with the results of reading a request pdf
+
+    attributes:
+        pdf: the path to the pdf
+        page_text: the text of the first page, empty if it could not be read
+        ocr: whether ocr was attempted
+        deas: dea numbers found in `page_text`
+        date_range: date ranges found in `page_text` using `re.findall`
+    """
+    pdf: Path
+    page_text: str
+    ocr: bool
+    deas: list[str]
+    date_range: list
+
+
+def parse_pdf(pdf: Path, ocr: bool) -> ParsedPdf:  # noqa: FBT001 | passed positionally by `ProcessPoolExecutor.map()`
+    """
+    read the first page of a request pdf, using ocr if it does not have readable text, and find the dea numbers and date ranges in it
+
+    args:
+        pdf: the path to the pdf
+        ocr: whether to force ocr
+
+    returns:
+        a `ParsedPdf` for the pdf
+    """
+    page = pymupdf.open(pdf).load_page(0)
+    page_text = page.get_text()  # type: ignore[reportAttributeAccessIssue] | pymupdf does not support static type checkers at this time
+
+    ocr = (not page_text) or ocr
+    if ocr:
+        pdfocr = page.get_pixmap(matrix=pymupdf.Matrix(2, 2)).pdfocr_tobytes()  # type: ignore[reportAttributeAccessIssue] | pymupdf does not support static type checkers at this time
+        page_text = pymupdf.open('pdf', pdfocr).load_page(0).get_text()  # type: ignore[reportAttributeAccessIssue] | pymupdf does not support static type checkers at this time
+
+    deas = re.findall(r'[A-Z]{2}\d{7}', page_text)  # type: ignore[reportCallIssue] | pymupdf does not support static type checkers at this time
+    date_range = re.findall(r'(\d{1,2}/\d{1,2}/(?:\d{4}|\d{2}))\s*(?:-|–|—|through|to)\s*(\d{1,2}/\d{1,2}/(?:\d{4}|\d{2}))', page_text)  # type: ignore[reportCallIssue] | pymupdf does not support static type checkers at this time
+    return ParsedPdf(pdf, page_text, ocr, deas, date_range)  # type: ignore[reportArgumentType] | pymupdf does not support static type checkers at this time
+
+
+def parse_pdfs(pdfs: list[Path], ocr: bool) -> Iterator[ParsedPdf]:  # noqa: FBT001 | only one flag
+    """
+    read pdfs across a process pool sized to the machine's cores
+    results are yielded in the order of `pdfs` as soon as each is ready, so later pdfs are still being read while earlier ones are used
+
+    args:
+        pdfs: paths to the pdfs
+        ocr: whether to force ocr
+
+    yields:
+        a `ParsedPdf` for each pdf
+    """
+    with ProcessPoolExecutor(max_workers=os.process_cpu_count()) as executor:
+        yield from executor.map(parse_pdf, pdfs, itertools.repeat(ocr))
+
+
 def process_pdf(request_type: RequestType) -> None:
     """
     process the input pdf(s) for DEA numbers and the daterange of the request
@@ -70,56 +136,49 @@ def process_pdf(request_type: RequestType) -> None:
     with log_fp.open('w', encoding='utf-8') as file:
         pass  # clear logs
 
-    pdfs = Path(f'data/{request_type}') if request_type == 'audit_trail' else Path(f'data/{request_type}_activity_request')
-    pdfs.mkdir(parents=True, exist_ok=True)
-    pdfs = pdfs.glob('*.pdf')
+    pdf_dir = Path(f'data/{request_type}') if request_type == 'audit_trail' else Path(f'data/{request_type}_activity_request')
+    pdf_dir.mkdir(parents=True, exist_ok=True)
+    pdfs = sorted(pdf_dir.glob('*.pdf'))
 
     if pdfs:
         print('---')
         print('reading pdf(s)')
-        for pdf in pdfs:
-            page = pymupdf.open(pdf).load_page(0)
-            page_text = page.get_text()  # type: ignore[reportAttributeAccessIssue] | pymupdf does not support static type checkers at this time
-
-            if (not page_text) or args.ocr:
+        for parsed in parse_pdfs(pdfs, args.ocr):
+            pdf = parsed.pdf
+            if parsed.ocr:
                 print('---')
                 print(f'{pdf} does not have readable text')
                 print('attempting ocr...')
-                pdfocr = page.get_pixmap(matrix=pymupdf.Matrix(2, 2)).pdfocr_tobytes()  # type: ignore[reportAttributeAccessIssue] | pymupdf does not support static type checkers at this time
-                page_text = pymupdf.open('pdf', pdfocr).load_page(0).get_text()  # type: ignore[reportAttributeAccessIssue] | pymupdf does not support static type checkers at this time
-
-                if not page_text:
+                if not parsed.page_text:
                     print(f'{pdf} could not be read through ocr')
                     continue
-            deas = re.findall(r'[A-Z]{2}\d{7}', page_text)  # type: ignore[reportCallIssue] | pymupdf does not support static type checkers at this time
-            if not deas:
+            if not parsed.deas:
                 print('---')
                 print(f'could not find any deas in {pdf}')
                 print(f'see {log_fp}')
                 with log_fp.open('a', encoding='utf-8') as file:
-                    file.write(f'---\ncould not find any deas in {pdf}\n:::\npage text:\n:::\n{page_text}\n---')
+                    file.write(f'---\ncould not find any deas in {pdf}\n:::\npage text:\n:::\n{parsed.page_text}\n---')
                 continue
-            date_range = re.findall(r'(\d{1,2}/\d{1,2}/(?:\d{4}|\d{2}))\s*(?:-|–|—|through|to)\s*(\d{1,2}/\d{1,2}/(?:\d{4}|\d{2}))', page_text)  # type: ignore[reportCallIssue] | pymupdf does not support static type checkers at this time
-            if not date_range:
+            if not parsed.date_range:
                 print('---')
                 print(f'could not find a daterange in {pdf}')
                 print(f'see {log_fp}')
                 with log_fp.open('a', encoding='utf-8') as file:
-                    file.write(f'---\ncould not find a daterange in {pdf}\n:::\npage text:\n:::\n{page_text}\n---')
+                    file.write(f'---\ncould not find a daterange in {pdf}\n:::\npage text:\n:::\n{parsed.page_text}\n---')
                 continue
 
             print('---')
-            start_date, end_date = parse_daterange(date_range)
+            start_date, end_date = parse_daterange(parsed.date_range)
             print(pdf)
-            print(deas)
+            print(parsed.deas)
             print(f'{start_date} - {end_date}\n')
-            search_params = SearchParameters(deas, start_date, end_date)
+            search_params = SearchParameters(parsed.deas, start_date, end_date)
             if request_type == 'audit_trail':
                 audit_trail(search_params)
             else:
                 activity_request(request_type, search_params)
     else:
-        sys.exit(f'no pdfs in data/{request_type}/ folder')
+        sys.exit(f'no pdfs in {pdf_dir}/ folder')
 
 
 def audit_trail(params: SearchParameters) -> None:
@@ -132,15 +191,15 @@ def audit_trail(params: SearchParameters) -> None:
     request_type = 'audit_trail'
     workbook_name = f'dea_{request_type}'
     print(f'finding luid for {workbook_name} report...')
-    user_ids_luid = tableau.find_view_luid('UserIDs', workbook_name)
+    user_ids_luid = cache.find_view_luid('UserIDs', workbook_name)
     print(f'luid found: {user_ids_luid}')
-    searches_luid = tableau.find_view_luid('Searches', workbook_name)
+    searches_luid = cache.find_view_luid('Searches', workbook_name)
     print(f'luid found: {searches_luid}')
-    users_luid = tableau.find_view_luid('users', workbook_name)
+    users_luid = cache.find_view_luid('users', workbook_name)
     print(f'luid found: {users_luid}')
 
     print('pulling users file...')
-    users_lf = tableau.lazyframe_from_view_id(users_luid, infer_schema=False)
+    users_lf = cache.lazyframe_from_view_id(users_luid, infer_schema=False, use_cache=not args.no_cache)
 
     user_ids = []
     for dea in params.deas:
@@ -150,7 +209,7 @@ def audit_trail(params: SearchParameters) -> None:
 
         print(f'pulling userids file for {dea}...')
         try:
-            user_ids_lf = tableau.lazyframe_from_view_id(user_ids_luid, filters, infer_schema=False)
+            user_ids_lf = cache.lazyframe_from_view_id(user_ids_luid, filters, infer_schema=False, use_cache=not args.no_cache)
         except tableau.TableauNoDataError:
             print(f'found no user ids for {dea}')
             continue
@@ -173,7 +232,7 @@ def audit_trail(params: SearchParameters) -> None:
 
         print(f'pulling searches for {user_id}...')
         try:
-            searches_lf = tableau.lazyframe_from_view_id(searches_luid, filters, infer_schema=False)
+            searches_lf = cache.lazyframe_from_view_id(searches_luid, filters, infer_schema=False, use_cache=not args.no_cache)
         except tableau.TableauNoDataError:
             print(f'{user_id} had no searches from {params.start_date} to {params.end_date}')
             continue
@@ -209,137 +268,153 @@ def audit_trail(params: SearchParameters) -> None:
         print(f'{fn} written')
 
 
+def pull_dea(request_type: RequestType, luid: str, dea: str, params: SearchParameters) -> None:
+    """
+    pull and write the activity report for one dea number
+
+    args:
+        request_type: RequestType for the activity request
+        luid: the luid of the activity report view
+        dea: the dea number to pull
+        params: SearchParameters for the request
+    """
+    filters = {
+        'dea': dea, 'start_date': params.start_date, 'end_date': params.end_date
+    }
+    if request_type == 'prescriber':
+        try:
+            lf = cache.lazyframe_from_view_id(luid, filters=filters, infer_schema=False, use_cache=not args.no_cache)
+        except tableau.TableauNoDataError:
+            print(f'no records found for {dea}')
+            return
+
+        lf = (
+            lf
+            .select(
+                pl.col('Prescriber DEA'),
+                pl.col('Prescriber NPI'),
+                pl.col('Prescriber First Name'),
+                pl.col('Prescriber Last Name'),
+                pl.col('Orig Prescriber Address Line One').alias('Prescriber Address'),
+                pl.col('Orig Prescriber Address Line Two').alias('Prescriber Address 2'),
+                pl.col('Orig Prescriber City').alias('Prescriber City'),
+                pl.col('Orig Prescriber State Abbr').alias('Prescriber State'),
+                pl.col('Orig Prescriber Zip').alias('Prescriber ZIP'),
+                pl.col('Pharmacy DEA'),
+                pl.col('Pharmacy NPI'),
+                pl.col('Pharmacy Retail Name').alias('Pharmacy Name'),
+                pl.col('Orig Pharmacy Address Line One').alias('Pharmacy Address'),
+                pl.col('Orig Pharmacy Address Line Two').alias('Pharmacy Address 2'),
+                pl.col('Orig Pharmacy City').alias('Pharmacy City'),
+                pl.col('Orig Pharmacy State Abbr').alias('Pharmacy State'),
+                pl.col('Orig Pharmacy Zip').alias('Pharmacy ZIP'),
+                pl.col('Pharmacy Chain Site Id'),
+                pl.col('Prescription Number').alias('Rx Number'),
+                pl.col('Day of Filled At').alias('Rx Fill Date'),
+                pl.col('Day of Written At').alias('Rx Written Date'),
+                pl.col('Refills Authorized').alias('Authorized Refills'),
+                pl.col('Refill Y/N'),
+                pl.col('Payment Type'),
+                pl.col('Drug Schedule'),
+                pl.col('AHFS Description').alias('AHFS Drug Category'),
+                pl.col('Brand Name').alias('Drug Name'),
+                pl.col('Quantity'),
+                pl.col('Strength'),
+                pl.col('Dosage Type'),
+                pl.col('Days Supply'),
+                pl.col('Daily MME'),
+                pl.col('Orig Patient First Name'),
+                pl.col('Orig Patient Last Name'),
+                pl.col('Day of Patient Birthdate').alias('Patient DOB'),
+                pl.col('Orig Patient Address Line One').alias('Patient Address'),
+                pl.col('Orig Patient Address Line Two').alias('Patient Address 2'),
+                pl.col('Orig Patient City').alias('Patient City'),
+                pl.col('Orig Patient State Abbr').alias('Patient State'),
+                pl.col('Orig Patient Zip').alias('Patient ZIP'),
+                pl.col('Veterinarian Prescription Y/N')
+            )
+        )
+    else:   # dispenser
+        try:
+            lf = cache.lazyframe_from_view_id(luid, filters=filters, infer_schema=False, use_cache=not args.no_cache)
+        except tableau.TableauNoDataError:
+            print(f'no records found for {dea}')
+            return
+        lf = (
+            lf
+            .select(
+                pl.col('Pharmacy DEA'),
+                pl.col('Pharmacy NPI'),
+                pl.col('Pharmacy Retail Name').alias('Pharmacy Name'),
+                pl.col('Orig Pharmacy Address Line One').alias('Pharmacy Address'),
+                pl.col('Orig Pharmacy Address Line Two').alias('Pharmacy Address 2'),
+                pl.col('Orig Pharmacy City').alias('Pharmacy City'),
+                pl.col('Orig Pharmacy State Abbr').alias('Pharmacy State'),
+                pl.col('Orig Pharmacy Zip').alias('Pharmacy ZIP'),
+                pl.col('Pharmacy Chain Site Id'),
+                pl.col('Orig Patient First Name'),
+                pl.col('Orig Patient Last Name'),
+                pl.col('Day of Patient Birthdate').alias('Patient DOB'),
+                pl.col('Orig Patient Address Line One').alias('Patient Address'),
+                pl.col('Orig Patient Address Line Two').alias('Patient Address 2'),
+                pl.col('Orig Patient City').alias('Patient City'),
+                pl.col('Orig Patient State Abbr').alias('Patient State'),
+                pl.col('Orig Patient Zip').alias('Patient ZIP'),
+                pl.col('Prescription Number').alias('Rx Number'),
+                pl.col('Day of Filled At').alias('Rx Fill Date'),
+                pl.col('Day of Written At').alias('Rx Written Date'),
+                pl.col('Refills Authorized').alias('Authorized Refills'),
+                pl.col('Refill Y/N'),
+                pl.col('Payment Type'),
+                pl.col('Drug Schedule'),
+                pl.col('AHFS Description').alias('AHFS Drug Category'),
+                pl.col('Brand Name').alias('Drug Name'),
+                pl.col('Quantity'),
+                pl.col('Strength'),
+                pl.col('Dosage Type'),
+                pl.col('Days Supply'),
+                pl.col('Daily MME'),
+                pl.col('Prescriber DEA'),
+                pl.col('Prescriber NPI'),
+                pl.col('Prescriber First Name'),
+                pl.col('Prescriber Last Name'),
+                pl.col('Orig Prescriber Address Line One').alias('Prescriber Address'),
+                pl.col('Orig Prescriber Address Line Two').alias('Prescriber Address 2'),
+                pl.col('Orig Prescriber City').alias('Prescriber City'),
+                pl.col('Orig Prescriber State Abbr').alias('Prescriber State'),
+                pl.col('Orig Prescriber Zip').alias('Prescriber ZIP'),
+                pl.col('Veterinarian Prescription Y/N'))
+            )
+
+    file_name = f'{dea}_{params.start_date}_-_{params.end_date}'
+    file_path = f'data/{request_type}_activity_request/{file_name}.csv'
+    try:
+        df = lf.collect()
+    except pl.exceptions.NoDataError:
+        pl.DataFrame({'message': f'no results found for {file_name}'}).write_csv(file_path)
+        print(f'{file_path} was empty, empty file written with message')
+    else:
+        df.write_csv(file_path)
+        print(f'{file_path} written')
+
+
 def activity_request(request_type: RequestType, params: SearchParameters) -> None:
     """
     perform a prescriber or dispenser activity request
+    dea numbers are pulled and written by `args.workers` threads at once, tableau pulls are paced by `cache.lazyframe_from_view_id()`
 
     args:
         request_type: RequestType for the activity request
         params: SearchParameters for the request
     """
     print(f'finding luid for {request_type} activity report...')
-    luid = tableau.find_view_luid(f'{request_type}_activity_request', 'DEA Records Request')
+    luid = cache.find_view_luid(f'{request_type}_activity_request', 'DEA Records Request')
     print(f'luid found: {luid}')
 
-    for dea in params.deas:
-        filters = {
-            'dea': dea, 'start_date': params.start_date, 'end_date': params.end_date
-        }
-        if request_type == 'prescriber':
-            try:
-                lf = tableau.lazyframe_from_view_id(luid, filters=filters, infer_schema=False)
-            except tableau.TableauNoDataError:
-                print(f'no records found for {dea}')
-                continue
-
-            lf = (
-                lf
-                .select(
-                    pl.col('Prescriber DEA'),
-                    pl.col('Prescriber NPI'),
-                    pl.col('Prescriber First Name'),
-                    pl.col('Prescriber Last Name'),
-                    pl.col('Orig Prescriber Address Line One').alias('Prescriber Address'),
-                    pl.col('Orig Prescriber Address Line Two').alias('Prescriber Address 2'),
-                    pl.col('Orig Prescriber City').alias('Prescriber City'),
-                    pl.col('Orig Prescriber State Abbr').alias('Prescriber State'),
-                    pl.col('Orig Prescriber Zip').alias('Prescriber ZIP'),
-                    pl.col('Pharmacy DEA'),
-                    pl.col('Pharmacy NPI'),
-                    pl.col('Pharmacy Retail Name').alias('Pharmacy Name'),
-                    pl.col('Orig Pharmacy Address Line One').alias('Pharmacy Address'),
-                    pl.col('Orig Pharmacy Address Line Two').alias('Pharmacy Address 2'),
-                    pl.col('Orig Pharmacy City').alias('Pharmacy City'),
-                    pl.col('Orig Pharmacy State Abbr').alias('Pharmacy State'),
-                    pl.col('Orig Pharmacy Zip').alias('Pharmacy ZIP'),
-                    pl.col('Pharmacy Chain Site Id'),
-                    pl.col('Prescription Number').alias('Rx Number'),
-                    pl.col('Day of Filled At').alias('Rx Fill Date'),
-                    pl.col('Day of Written At').alias('Rx Written Date'),
-                    pl.col('Refills Authorized').alias('Authorized Refills'),
-                    pl.col('Refill Y/N'),
-                    pl.col('Payment Type'),
-                    pl.col('Drug Schedule'),
-                    pl.col('AHFS Description').alias('AHFS Drug Category'),
-                    pl.col('Brand Name').alias('Drug Name'),
-                    pl.col('Quantity'),
-                    pl.col('Strength'),
-                    pl.col('Dosage Type'),
-                    pl.col('Days Supply'),
-                    pl.col('Daily MME'),
-                    pl.col('Orig Patient First Name'),
-                    pl.col('Orig Patient Last Name'),
-                    pl.col('Day of Patient Birthdate').alias('Patient DOB'),
-                    pl.col('Orig Patient Address Line One').alias('Patient Address'),
-                    pl.col('Orig Patient Address Line Two').alias('Patient Address 2'),
-                    pl.col('Orig Patient City').alias('Patient City'),
-                    pl.col('Orig Patient State Abbr').alias('Patient State'),
-                    pl.col('Orig Patient Zip').alias('Patient ZIP'),
-                    pl.col('Veterinarian Prescription Y/N')
-                )
-            )
-        else:   # dispenser
-            try:
-                lf = tableau.lazyframe_from_view_id(luid, filters=filters, infer_schema=False)
-            except tableau.TableauNoDataError:
-                print(f'no records found for {dea}')
-                continue
-            lf = (
-                lf
-                .select(
-                    pl.col('Pharmacy DEA'),
-                    pl.col('Pharmacy NPI'),
-                    pl.col('Pharmacy Retail Name').alias('Pharmacy Name'),
-                    pl.col('Orig Pharmacy Address Line One').alias('Pharmacy Address'),
-                    pl.col('Orig Pharmacy Address Line Two').alias('Pharmacy Address 2'),
-                    pl.col('Orig Pharmacy City').alias('Pharmacy City'),
-                    pl.col('Orig Pharmacy State Abbr').alias('Pharmacy State'),
-                    pl.col('Orig Pharmacy Zip').alias('Pharmacy ZIP'),
-                    pl.col('Pharmacy Chain Site Id'),
-                    pl.col('Orig Patient First Name'),
-                    pl.col('Orig Patient Last Name'),
-                    pl.col('Day of Patient Birthdate').alias('Patient DOB'),
-                    pl.col('Orig Patient Address Line One').alias('Patient Address'),
-                    pl.col('Orig Patient Address Line Two').alias('Patient Address 2'),
-                    pl.col('Orig Patient City').alias('Patient City'),
-                    pl.col('Orig Patient State Abbr').alias('Patient State'),
-                    pl.col('Orig Patient Zip').alias('Patient ZIP'),
-                    pl.col('Prescription Number').alias('Rx Number'),
-                    pl.col('Day of Filled At').alias('Rx Fill Date'),
-                    pl.col('Day of Written At').alias('Rx Written Date'),
-                    pl.col('Refills Authorized').alias('Authorized Refills'),
-                    pl.col('Refill Y/N'),
-                    pl.col('Payment Type'),
-                    pl.col('Drug Schedule'),
-                    pl.col('AHFS Description').alias('AHFS Drug Category'),
-                    pl.col('Brand Name').alias('Drug Name'),
-                    pl.col('Quantity'),
-                    pl.col('Strength'),
-                    pl.col('Dosage Type'),
-                    pl.col('Days Supply'),
-                    pl.col('Daily MME'),
-                    pl.col('Prescriber DEA'),
-                    pl.col('Prescriber NPI'),
-                    pl.col('Prescriber First Name'),
-                    pl.col('Prescriber Last Name'),
-                    pl.col('Orig Prescriber Address Line One').alias('Prescriber Address'),
-                    pl.col('Orig Prescriber Address Line Two').alias('Prescriber Address 2'),
-                    pl.col('Orig Prescriber City').alias('Prescriber City'),
-                    pl.col('Orig Prescriber State Abbr').alias('Prescriber State'),
-                    pl.col('Orig Prescriber Zip').alias('Prescriber ZIP'),
-                    pl.col('Veterinarian Prescription Y/N'))
-                )
-
-        file_name = f'{dea}_{params.start_date}_-_{params.end_date}'
-        file_path = f'data/{request_type}_activity_request/{file_name}.csv'
-        try:
-            df = lf.collect()
-        except pl.exceptions.NoDataError:
-            pl.DataFrame({'message': f'no results found for {file_name}'}).write_csv(file_path)
-            print(f'{file_path} was empty, empty file written with message')
-        else:
-            df.write_csv(file_path)
-            print(f'{file_path} written')
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(pull_dea, request_type, luid, dea, params) for dea in params.deas]
+        for future in futures:
+            future.result()
 
 
 if __name__ == '__main__':
@@ -350,6 +425,8 @@ if __name__ == '__main__':
     group.add_argument('-at', '--audit-trail', action='store_true', help='pull audit trail')
     parser.add_argument('-o', '--ocr', action='store_true', help='force ocr for pdf reading')
     parser.add_argument('-mu', '--mandatory-use', action='store_true', help='optimize the file for mu recheck')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='number of dea numbers to pull at once (default: %(default)s)')
+    parser.add_argument('-nc', '--no-cache', action='store_true', help='pull every view from tableau instead of using cached pulls')
     args = parser.parse_args()
 
     if args.prescriber:
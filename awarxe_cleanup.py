@@ -1,7 +1,9 @@
 from pathlib import Path
 
 import polars as pl
-from az_pmp_utils import deas, drive, files, tableau
+from dotenv import load_dotenv
+
+import cache
 
 
 def pull_awarxe() -> pl.DataFrame:
@@ -11,7 +13,7 @@ def pull_awarxe() -> pl.DataFrame:
     returns:
         a dataframe with all active awarxe registants
     """
-    return drive.awarxe().collect()
+    return cache.awarxe().collect()
 
 
 def tab_awarxe() -> pl.LazyFrame:
@@ -22,8 +24,8 @@ def tab_awarxe() -> pl.LazyFrame:
         a lazyframe with the tableau version of active awarxe registrants
     """
     print('pulling awarxe from tableau...')
-    luid = tableau.find_view_luid('active_approved', 'tab_awarxe')
-    return tableau.lazyframe_from_view_id(luid, infer_schema=False)
+    luid = cache.find_view_luid('active_approved', 'tab_awarxe')
+    return cache.lazyframe_from_view_id(luid, infer_schema=False)
 
 
 def read_all_deas() -> pl.LazyFrame:
@@ -33,7 +35,7 @@ def read_all_deas() -> pl.LazyFrame:
     returns:
         a lazyframe of all dea registrants
     """
-    return deas.deas()
+    return cache.deas()
 
 
 def bad_deas(awarxe: pl.DataFrame) -> None:
@@ -287,17 +289,8 @@ def multiple_deas(awarxe: pl.DataFrame, dea_list: pl.LazyFrame) -> None:
 
 def closed_pharmacies_in_mp() -> None:
     """finds pharmacies from manage pharmacies that are not open in igov"""
-    mp_path = Path('data/pharmacies.csv')
-    files.warn_file_age(mp_path)
-
-    lr_path = Path('data/List Request.csv')
-    files.warn_file_age(lr_path)
-
     mp = (
-        pl.scan_csv(mp_path)
-        .with_columns(
-            pl.col('DEA').str.strip_chars().str.to_uppercase()
-        )
+        cache.manage_pharmacies()
         .filter(
             pl.col('Reporting Requirements') != 'Exempt'
         )
@@ -305,13 +298,10 @@ def closed_pharmacies_in_mp() -> None:
     )
 
     igov = (
-        pl.scan_csv(lr_path, infer_schema=False)
+        cache.list_request()
         .filter(
             pl.col('Type') == 'Pharmacy'
         )
-        .with_columns(
-            pl.col('License/Permit #').str.strip_chars().str.to_uppercase()
-        )
         .rename(
             {'License/Permit #': 'Pharmacy License Number'}
         )
@@ -335,6 +325,7 @@ def closed_pharmacies_in_mp() -> None:
 
 
 if __name__ == '__main__':
+    load_dotenv()
     Path('data/awarxe_cleanup').mkdir(parents=True, exist_ok=True)
     awarxe = pull_awarxe()
     dea_list = read_all_deas()
@@ -0,0 +1,521 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+import polars as pl
+import tableauserverclient as tsc
+from az_pmp_utils import deas as az_deas
+from az_pmp_utils import drive, files, tableau
+
+import services
+from constants import (
+    CACHE_DIR,
+    DEA_FILE,
+    LIST_REQUEST_FILE,
+    MANAGE_PHARMACIES_FILE,
+    PHX_TZ,
+    TABLEAU_LUID_TTL,
+    TABLEAU_REQUESTS_PER_SECOND,
+    TABLEAU_RESULT_CACHE_BYTES,
+    TABLEAU_RESULT_TTL,
+)
+from ratelimit import RateLimiter
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+    from pathlib import Path
+
+DEA_PARTITION_COLS = ['State', 'Business Activity Code']
+DEA_DATE_COLS = ['Date of Original Registration', 'Expiration Date']
+LUID_CACHE_FILE = CACHE_DIR / 'tableau_luids.json'
+RESULT_CACHE_DIR = CACHE_DIR / 'tableau_results'
+SHEET_CACHE_DIR = CACHE_DIR / 'sheets'
+
+_luid_lock = threading.Lock()
+_luid_redirects: dict[str, str] = {}
+_result_lock = threading.Lock()
+_tableau_limiter = RateLimiter(TABLEAU_REQUESTS_PER_SECOND)
+_modified_lock = threading.Lock()
+_modified_times: dict[str, str] = {}
+
+
+def _version_tag(version: str) -> str:
+    """
+    makes a version string safe for use in a file name
+
+    args:
+        version: a version string, eg: a drive `modifiedTime`
+
+    returns:
+        the version with anything other than letters, numbers, `-`, and `_` replaced with `_`
+    """
+    return re.sub(r'[^0-9A-Za-z_-]', '_', version)
+
+
+def _remove_old_versions(snapshot_dir: Path, keep: Path) -> None:
+    """
+    removes every file and folder in `snapshot_dir` other than `keep`
+
+    args:
+        snapshot_dir: the folder holding all versions of a snapshot
+        keep: the path of the current version
+    """
+    for old in snapshot_dir.iterdir():
+        if old != keep:
+            if old.is_dir():
+                shutil.rmtree(old)
+            else:
+                old.unlink()
+
+
+def snapshot(name: str, version: str, loader: Callable[[], pl.LazyFrame]) -> pl.LazyFrame:
+    """
+    returns a lazyframe over a local arrow ipc snapshot of `name` at `version`
+    if no snapshot exists for `version`, `loader` is collected and written to `CACHE_DIR/{name}/` and older versions are removed
+
+    args:
+        name: the name of the snapshot, used as the folder name in `CACHE_DIR`
+        version: a string that changes whenever the source changes, eg: a drive `modifiedTime`
+        loader: a function returning a lazyframe of the source, only called when the snapshot is missing
+
+    returns:
+        a memory mapped lazyframe over the cached snapshot
+    """
+    snapshot_dir = CACHE_DIR / name
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    snapshot_path = snapshot_dir / f'{_version_tag(version)}.arrow'
+
+    if not snapshot_path.exists():
+        print(f'caching {name} snapshot for {version}...')
+        temp_path = snapshot_path.with_suffix('.tmp')
+        loader().collect().write_ipc(temp_path)
+        temp_path.replace(snapshot_path)
+        _remove_old_versions(snapshot_dir, snapshot_path)
+        print(f'{snapshot_path} written')
+
+    return pl.scan_ipc(snapshot_path, memory_map=True)
+
+
+def latest_modified_time(service, folder_id: str) -> str | None:  # noqa: ANN001 | service is dynamically typed
+    """
+    gets the `modifiedTime` of the most recently modified file in a google drive folder
+
+    args:
+        service: an authorized google drive service
+        folder_id: the id of the folder on the google drive
+
+    returns:
+        the id and `modifiedTime` of the newest file in the folder, or None if the folder is empty
+    """
+    results = service.files().list(
+        q=f"'{folder_id}' in parents and trashed = false and mimeType != 'application/vnd.google-apps.folder'",
+        orderBy='modifiedTime desc',
+        pageSize=1,
+        supportsAllDrives=True,
+        includeItemsFromAllDrives=True,
+        fields='files(id, modifiedTime)'
+    ).execute()
+    files = results.get('files', [])
+    if not files:
+        return None
+    return f'{files[0]['id']}_{files[0]['modifiedTime']}'
+
+
+def awarxe(service=None) -> pl.LazyFrame:  # noqa: ANN001 | service is dynamically typed
+    """
+    returns the awarxe registrants file from a local snapshot, only downloading it through `drive.awarxe()` when the newest file in `AWARXE_FOLDER` has changed
+
+    args:
+        service: an authorized google drive service, the pooled service is used if not provided
+
+    returns:
+        a lazyframe with all active awarxe registrants
+    """
+    if service is None:
+        service = services.drive()
+    version = latest_modified_time(service, os.environ['AWARXE_FOLDER'])
+    if version is None:
+        return drive.awarxe(service=service)
+    return snapshot('awarxe', version, lambda: drive.awarxe(service=service))
+
+
+def deas(kind: str | None = None) -> pl.LazyFrame:
+    """
+    returns the dea registrants from a local parquet store, only parsing `DEA_FILE` through `deas.deas()` when it has changed
+    the store is partitioned by `State` and `Business Activity Code` and sorted within each partition,
+    and the date columns are parsed to `pl.Date`, so filters on those columns only read the files they need
+
+    args:
+        kind: the kind of registrants passed to `deas.deas()`, eg: 'presc' or 'pharm', all registrants if None
+
+    returns:
+        a lazyframe of dea registrants with typed date columns
+    """
+    stat = DEA_FILE.stat()
+    version = f'{stat.st_mtime_ns}_{stat.st_size}'
+    store_dir = CACHE_DIR / (f'deas_{kind}' if kind else 'deas')
+    store_dir.mkdir(parents=True, exist_ok=True)
+    store_path = store_dir / _version_tag(version)
+    columns_path = store_path / 'columns.json'
+
+    if not store_path.exists():
+        print(f'writing {DEA_FILE} to parquet...')
+        registrants = (
+            (az_deas.deas(kind) if kind else az_deas.deas())
+            .with_columns(
+                pl.col(DEA_DATE_COLS).str.to_date('%Y%m%d', strict=False)
+            )
+            .sort(DEA_PARTITION_COLS)
+            .collect()
+        )
+        temp_path = store_path.with_suffix('.tmp')
+        if temp_path.exists():
+            shutil.rmtree(temp_path)
+        registrants.write_parquet(temp_path, partition_by=DEA_PARTITION_COLS)
+        (temp_path / 'columns.json').write_text(json.dumps(registrants.columns), encoding='utf-8')
+        temp_path.replace(store_path)
+        _remove_old_versions(store_dir, store_path)
+        print(f'{store_path} written')
+
+    columns = json.loads(columns_path.read_text(encoding='utf-8'))
+    return (
+        pl.scan_parquet(
+            store_path / '**/*.parquet',
+            hive_partitioning=True,
+            hive_schema=dict.fromkeys(DEA_PARTITION_COLS, pl.String),
+        )
+        .select(columns)
+    )
+
+
+def prefetch_modified_times(file_ids: Iterable[str]) -> None:
+    """
+    checks the `modifiedTime` of several google drive files with a single batch http request
+    each time is used by the next `sheet()` call for that file, so a script can check all of its sheets at once before reading them
+
+    args:
+        file_ids: the ids of the files on the google drive
+    """
+    service = services.drive()
+    requests = {
+        file_id: service.files().get(fileId=file_id, fields='id, modifiedTime', supportsAllDrives=True)
+        for file_id in set(file_ids)
+    }
+    responses = services.execute_batch(service, requests)
+    with _modified_lock:
+        _modified_times.update({file_id: response['modifiedTime'] for file_id, response in responses.items()})
+
+
+def _modified_time(file_id: str) -> str:
+    """
+    gets the `modifiedTime` of a google drive file, using the time from `prefetch_modified_times()` if there is one
+    a prefetched time is only used once, so reading a sheet again after a script updates it checks the file again
+
+    args:
+        file_id: the id of the file on the google drive
+
+    returns:
+        the `modifiedTime` of the file
+    """
+    with _modified_lock:
+        modified_time = _modified_times.pop(file_id, None)
+    if modified_time is None:
+        modified_time = services.drive().files().get(fileId=file_id, fields='id, modifiedTime', supportsAllDrives=True).execute()['modifiedTime']
+    return modified_time
+
+
+def sheet(file_id: str, sheet_name: str, **kwargs) -> pl.LazyFrame:
+    """
+    `drive.lazyframe_from_id_and_sheetname()` served from a local parquet copy of the sheet while the file is unchanged
+    the file's `modifiedTime` is checked with one metadata call, and the workbook is only downloaded and parsed again when it has changed,
+    copies are kept in `SHEET_CACHE_DIR/{file_id}/` keyed by a hash of the sheet name and read options, and older versions are removed
+
+    args:
+        file_id: the id of the file on the google drive
+        sheet_name: the name of the sheet in the file
+        **kwargs: passed to `drive.lazyframe_from_id_and_sheetname()`
+
+    returns:
+        a lazyframe over the cached sheet
+    """
+    version = _modified_time(file_id)
+    read = {'sheet_name': sheet_name, 'read_options': {str(k): str(v) for k, v in kwargs.items()}}
+    read_key = hashlib.sha256(json.dumps(read, sort_keys=True).encode()).hexdigest()[:16]
+    sheet_dir = SHEET_CACHE_DIR / file_id / read_key
+    sheet_dir.mkdir(parents=True, exist_ok=True)
+    sheet_path = sheet_dir / f'{_version_tag(version)}.parquet'
+
+    if not sheet_path.exists():
+        print(f'caching {sheet_name} sheet for {version}...')
+        temp_path = sheet_path.with_name(f'{sheet_path.stem}_{threading.get_ident()}.tmp')
+        drive.lazyframe_from_id_and_sheetname(file_id, sheet_name, service=services.drive(), **kwargs).collect().write_parquet(temp_path)
+        temp_path.replace(sheet_path)
+        _remove_old_versions(sheet_dir, sheet_path)
+
+    return pl.scan_parquet(sheet_path)
+
+
+def _ingest_csv(csv_path: Path, name: str, key: str) -> pl.LazyFrame:
+    """
+    returns a lazyframe over a local parquet copy of an exported csv, the csv is only parsed again when it has been replaced with a new export
+    every column is read as a string and `key` is stripped, uppercased, and used to sort the parquet file
+
+    args:
+        csv_path: the path to the exported csv
+        name: the name of the copy, used as the folder name in `CACHE_DIR`
+        key: the column used to join this file to others
+
+    returns:
+        a lazyframe over the parquet copy
+    """
+    files.warn_file_age(csv_path)
+    stat = csv_path.stat()
+    version = f'{stat.st_mtime_ns}_{stat.st_size}'
+    ingest_dir = CACHE_DIR / name
+    ingest_dir.mkdir(parents=True, exist_ok=True)
+    ingest_path = ingest_dir / f'{_version_tag(version)}.parquet'
+
+    if not ingest_path.exists():
+        print(f'writing {csv_path} to parquet...')
+        temp_path = ingest_path.with_suffix('.tmp')
+        (
+            pl.scan_csv(csv_path, infer_schema=False)
+            .with_columns(
+                pl.col(key).str.strip_chars().str.to_uppercase()
+            )
+            .sort(key, nulls_last=True)
+            .collect()
+            .write_parquet(temp_path)
+        )
+        temp_path.replace(ingest_path)
+        _remove_old_versions(ingest_dir, ingest_path)
+        print(f'{ingest_path} written')
+
+    return pl.scan_parquet(ingest_path)
+
+
+def list_request(lr_path: Path = LIST_REQUEST_FILE) -> pl.LazyFrame:
+    """
+    returns the igov list request with `License/Permit #` stripped and uppercased
+
+    args:
+        lr_path: path to the list request file
+
+    returns:
+        a lazyframe of the list request
+    """
+    return _ingest_csv(lr_path, 'list_request', 'License/Permit #')
+
+
+def manage_pharmacies(mp_path: Path = MANAGE_PHARMACIES_FILE) -> pl.LazyFrame:
+    """
+    returns the awarxe manage pharmacies file with `DEA` stripped and uppercased
+
+    args:
+        mp_path: path to the manage pharmacies file
+
+    returns:
+        a lazyframe of manage pharmacies
+    """
+    return _ingest_csv(mp_path, 'manage_pharmacies', 'DEA')
+
+
+def _read_luids() -> dict[str, dict[str, str]]:
+    """
+    reads the view luid cache
+
+    returns:
+        a dict with `{workbook_name}/{view_name}` as the key and a dict with the `luid`, `view_name`, `workbook_name`, and `cached_at` as the value
+    """
+    if not LUID_CACHE_FILE.exists():
+        return {}
+    try:
+        return json.loads(LUID_CACHE_FILE.read_text(encoding='utf-8'))
+    except json.JSONDecodeError:
+        return {}
+
+
+def _write_luids(luids: dict[str, dict[str, str]]) -> None:
+    """
+    writes the view luid cache
+
+    args:
+        luids: the dict returned by `_read_luids()` with any changes
+    """
+    LUID_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = LUID_CACHE_FILE.with_suffix('.tmp')
+    temp_path.write_text(json.dumps(luids, indent=2), encoding='utf-8')
+    temp_path.replace(LUID_CACHE_FILE)
+
+
+def find_view_luid(view_name: str, workbook_name: str) -> str:
+    """
+    finds the luid for a tableau view, using the local luid cache when the cached luid is younger than `TABLEAU_LUID_TTL`
+
+    args:
+        view_name: the name of the view
+        workbook_name: the name of the workbook with the view
+
+    returns:
+        the luid of the view
+    """
+    key = f'{workbook_name}/{view_name}'
+    now = datetime.now(tz=PHX_TZ)
+    with _luid_lock:
+        entry = _read_luids().get(key)
+    if entry and now - datetime.fromisoformat(entry['cached_at']) < TABLEAU_LUID_TTL:
+        return entry['luid']
+
+    luid = tableau.find_view_luid(view_name, workbook_name)
+    with _luid_lock:
+        luids = _read_luids()
+        luids[key] = {'luid': luid, 'view_name': view_name, 'workbook_name': workbook_name, 'cached_at': now.isoformat()}
+        _write_luids(luids)
+    return luid
+
+
+def invalidate_view_luid(luid: str) -> tuple[str, str] | None:
+    """
+    removes a luid from the local luid cache
+
+    args:
+        luid: the luid to remove
+
+    returns:
+        the `(view_name, workbook_name)` the luid was cached for, or None if it was not cached
+    """
+    with _luid_lock:
+        luids = _read_luids()
+        for key, entry in luids.items():
+            if entry['luid'] == luid:
+                del luids[key]
+                _write_luids(luids)
+                return entry['view_name'], entry['workbook_name']
+    return None
+
+
+def _pull_view(view_id: str, filters: dict | None, **kwargs) -> pl.LazyFrame:
+    """
+    `tableau.lazyframe_from_view_id()` with automatic invalidation of the local luid cache
+    if the server does not find `view_id`, the cached luid is dropped, found again with `find_view_luid()`, and the pull is retried
+    pulls from all threads are paced to `TABLEAU_REQUESTS_PER_SECOND`
+
+    args:
+        view_id: the luid of the view
+        filters: a dict of view filters for the pull
+        **kwargs: passed to `tableau.lazyframe_from_view_id()`
+
+    returns:
+        a lazyframe of the view
+
+    raises:
+        ServerResponseError: any error from the server other than the view not being found, or not found for a luid that was not cached
+    """
+    view_id = _luid_redirects.get(view_id, view_id)
+    _tableau_limiter.acquire()
+    try:
+        return tableau.lazyframe_from_view_id(view_id, filters, **kwargs)
+    except tsc.ServerResponseError as error:
+        if not str(error.code).startswith('404'):
+            raise
+        view = invalidate_view_luid(view_id)
+        if view is None:
+            raise
+        print(f'{view_id} was not found, finding luid for {view[1]}/{view[0]} again...')
+        new_luid = find_view_luid(*view)
+        _luid_redirects[view_id] = new_luid
+        _tableau_limiter.acquire()
+        return tableau.lazyframe_from_view_id(new_luid, filters, **kwargs)
+
+
+def _result_key(view_id: str, filters: dict | None, read_options: dict) -> str:
+    """
+    hashes a view pull into a key for the result cache
+
+    args:
+        view_id: the luid of the view
+        filters: a dict of view filters for the pull
+        read_options: the kwargs passed to `tableau.lazyframe_from_view_id()`, these change the parsed result
+
+    returns:
+        a sha256 hex digest of the normalized pull
+    """
+    pull = {
+        'view_id': _luid_redirects.get(view_id, view_id),
+        'filters': {str(k): str(v) for k, v in (filters or {}).items()},
+        'read_options': {str(k): str(v) for k, v in read_options.items()},
+    }
+    return hashlib.sha256(json.dumps(pull, sort_keys=True).encode()).hexdigest()
+
+
+def _evict_results(max_bytes: int, ttl: timedelta) -> None:
+    """
+    removes expired results from the result cache, then removes the least recently used results until the cache is under `max_bytes`
+
+    args:
+        max_bytes: the max total size of the result cache
+        ttl: results pulled longer ago than this are removed
+    """
+    now = datetime.now(tz=PHX_TZ).timestamp()
+    results = []
+    for path in RESULT_CACHE_DIR.glob('*.parquet'):
+        stat = path.stat()
+        if now - stat.st_mtime > ttl.total_seconds():
+            path.unlink(missing_ok=True)
+        else:
+            results.append((stat.st_atime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in results)
+    for _, size, path in sorted(results):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+def lazyframe_from_view_id(view_id: str, filters: dict | None = None, *, use_cache: bool = False, ttl: timedelta = TABLEAU_RESULT_TTL, **kwargs) -> pl.LazyFrame:
+    """
+    `tableau.lazyframe_from_view_id()` with automatic invalidation of the local luid cache and an opt-in result cache
+    if the server does not find `view_id`, the cached luid is dropped, found again with `find_view_luid()`, and the pull is retried
+    with `use_cache`, each result is kept as parquet in `RESULT_CACHE_DIR` keyed by a hash of the luid, filters, and read options,
+    the cache is kept under `TABLEAU_RESULT_CACHE_BYTES` by removing the least recently used results,
+    so cached results are read into memory instead of scanned, since the file can be removed by another thread's pull
+
+    args:
+        view_id: the luid of the view, preferably from `find_view_luid()`
+        filters: a dict of view filters for the pull
+        use_cache: whether to use the result cache
+        ttl: how long a cached result is used before pulling the view again
+        **kwargs: passed to `tableau.lazyframe_from_view_id()`
+
+    returns:
+        a lazyframe of the view
+    """
+    if not use_cache:
+        return _pull_view(view_id, filters, **kwargs)
+
+    result_path = RESULT_CACHE_DIR / f'{_result_key(view_id, filters, kwargs)}.parquet'
+    now = datetime.now(tz=PHX_TZ).timestamp()
+    with _result_lock:
+        if result_path.exists() and now - result_path.stat().st_mtime <= ttl.total_seconds():
+            os.utime(result_path, (now, result_path.stat().st_mtime))  # atime marks the result as recently used, mtime stays the time it was pulled
+            return pl.read_parquet(result_path).lazy()  # read under the lock, another thread's pull could evict the file before a scan is collected
+
+    lf = _pull_view(view_id, filters, **kwargs)
+    try:
+        df = lf.collect()
+    except pl.exceptions.NoDataError:
+        return lf  # nothing to cache, let the caller handle the empty result
+
+    RESULT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = result_path.with_name(f'{result_path.stem}_{threading.get_ident()}.tmp')
+    df.write_parquet(temp_path)
+    with _result_lock:
+        temp_path.replace(result_path)
+        _evict_results(TABLEAU_RESULT_CACHE_BYTES, ttl)
+    return df.lazy()
@@ -1,75 +1,105 @@
 import argparse
 import os
 from datetime import datetime, timedelta
+from pathlib import Path
 
 import polars as pl
-from az_pmp_utils import auth, drive
-from df_compare_pl import df_compare
+from az_pmp_utils import drive
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 
+import masked
+import services
 from constants import PHX_TZ
 
-parser = argparse.ArgumentParser(description='check masked extract')
-parser.add_argument('-o', '--old', type=int, default=0, help='check as if n months in the past')
-args = parser.parse_args()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='check masked extract')
+    parser.add_argument('-o', '--old', type=int, default=0, help='check as if n months in the past')
+    parser.add_argument('-s', '--stream', action='store_true', help='check the extract in one streaming pass instead of loading it into memory')
+    parser.add_argument('-d', '--diff', action='store_true', help='also compare the rows of the extract and the preceding file, writing the differences to data/mask_diff/')
+    parser.add_argument('-k', '--key', nargs='+', default=None, help='columns that identify a row for --diff, so rows with the same key and different values are reported as changed (default: the whole row)')
+    parser.add_argument('-t', '--trend', type=int, default=0, help='also print the stats for the last n masked extracts from their metadata sidecars')
+    args = parser.parse_args()
 
-load_dotenv()
-creds = auth.auth()
-service = build('drive', 'v3', credentials=creds)
+    load_dotenv()
+    service = services.drive()
 
-current_month_date = datetime.now(tz=PHX_TZ).replace(day=1)
-for _ in range(args.old):
-    current_month_date = current_month_date.replace(day=1) - timedelta(days=1)
-mask_month = current_month_date.month
-mask_year = current_month_date.year - 7
-prev_file_m_d = current_month_date.replace(day=1, year=mask_year) - timedelta(days=1)
-prev_month = prev_file_m_d.month
-prev_year = prev_file_m_d.year
+    current_month_date = datetime.now(tz=PHX_TZ).replace(day=1)
+    for _ in range(args.old):
+        current_month_date = current_month_date.replace(day=1) - timedelta(days=1)
+    mask_month = current_month_date.month
+    mask_year = current_month_date.year - 7
+    prev_file_m_d = current_month_date.replace(day=1, year=mask_year) - timedelta(days=1)
+    prev_month = prev_file_m_d.month
+    prev_year = prev_file_m_d.year
 
-masked_extract_folder = os.environ['MASKED_EXTRACT_FOLDER']
-print('getting folder ids...')
-masked_extract_year_folder = drive.folder_id_from_name(folder_name=f'{mask_year}', parent_folder_id=masked_extract_folder, service=service)
-masked_extract_prev_year_folder = drive.folder_id_from_name(folder_name=f'{prev_year}', parent_folder_id=masked_extract_folder, service=service)
+    masked_extract_folder = os.environ['MASKED_EXTRACT_FOLDER']
+    print('getting folder ids...')
+    masked_extract_year_folder = drive.folder_id_from_name(folder_name=f'{mask_year}', parent_folder_id=masked_extract_folder, service=service)
+    masked_extract_prev_year_folder = drive.folder_id_from_name(folder_name=f'{prev_year}', parent_folder_id=masked_extract_folder, service=service)
 
-mask_fn = f'AZ_{mask_year}{str(mask_month).zfill(2)}_masked.csv'
-mask_file = drive.lazyframe_from_file_name(file_name=mask_fn, folder_id=masked_extract_year_folder, drive_ft='csv', service=service, separator='|', infer_schema=False).collect()
-prev_fn = f'AZ_{prev_year}{str(prev_month).zfill(2)}_masked.csv'
-prev_file = drive.lazyframe_from_file_name(file_name=prev_fn, folder_id=masked_extract_prev_year_folder, drive_ft='csv', service=service, separator='|', infer_schema=False).collect()
+    mask_fn = f'AZ_{mask_year}{str(mask_month).zfill(2)}_masked.csv'
+    prev_fn = f'AZ_{prev_year}{str(prev_month).zfill(2)}_masked.csv'
 
-data_retention_folder = os.environ['DATA_RETENTION_FOLDER']
-data_retention_year_folder = drive.folder_id_from_name(folder_name=f'{mask_year}', parent_folder_id=data_retention_folder, service=service)
-data_retention_fn = f'data_retention_{mask_year}{str(mask_month).zfill(2)}.csv'
-data_retention_file = drive.lazyframe_from_file_name(file_name=data_retention_fn, folder_id=data_retention_year_folder, drive_ft='csv', service=service, separator='|', infer_schema=False).collect()
+    data_retention_folder = os.environ['DATA_RETENTION_FOLDER']
+    data_retention_year_folder = drive.folder_id_from_name(folder_name=f'{mask_year}', parent_folder_id=data_retention_folder, service=service)
+    data_retention_fn = f'data_retention_{mask_year}{str(mask_month).zfill(2)}.csv'
+    data_retention_file = drive.lazyframe_from_file_name(file_name=data_retention_fn, folder_id=data_retention_year_folder, drive_ft='csv', service=service, separator='|', infer_schema=False).collect()
+    dr_count = int(data_retention_file.item())
 
-print('-----')
-print(f'comparing a:{mask_fn} and b:{prev_fn}...')
-print('-----')
-if df_compare(mask_file, prev_file, col_only=True):
-    print('columns are equal')
-print('-----')
-print(f'{mask_fn} row count: {mask_file.height}')
-print(f'{prev_fn} row count: {prev_file.height}')
-percent_change = round((((mask_file.height - prev_file.height) / prev_file.height) * 100), 2)
-print(f'percent change: {percent_change}')
-print('-----')
-print(f'{mask_fn} row count: {mask_file.height}')
-dr_count = int(data_retention_file.item())
-print(f'{data_retention_fn} count: {dr_count}')
-percent_dif = round((((mask_file.height - dr_count) / dr_count) * 100), 2)
-print(f'percent difference: {percent_dif}')
-print('-----')
-filled_dates = (
-    mask_file
-    .with_columns(
-        pl.col('dispensation_filled_at').str.to_date('%Y-%m-%d')
-    )
-)
-min_filled_date = filled_dates.select(pl.col('dispensation_filled_at').min()).item().strftime('%Y-%m-%d')
-max_filled_date = filled_dates.select(pl.col('dispensation_filled_at').max()).item().strftime('%Y-%m-%d')
-print(f'{mask_fn} {min_filled_date = }')
-print(f'{mask_fn} {max_filled_date = }')
-print('-----')
-sample = mask_file.sample(20)
-sample.write_csv('data/mask_sample.csv')
-print('data/mask_sample.csv updated')
+    mask_extract = masked.find_file(service, mask_fn, masked_extract_year_folder)
+    if args.stream:
+        print(f'streaming {mask_fn}...')
+        mask_stats = masked.scan_extract(masked.stream_lines(service, mask_extract['id']))  # type: ignore[reportOptionalSubscript] | required files are not None
+    else:
+        mask_file = drive.lazyframe_from_file_name(file_name=mask_fn, folder_id=masked_extract_year_folder, drive_ft='csv', service=service, separator='|', infer_schema=False).collect()
+        mask_stats = masked.ExtractStats.from_frame(mask_file)
+    masked.write_metadata(service, mask_stats.metadata(mask_extract['md5Checksum']), mask_fn, masked_extract_year_folder)  # type: ignore[reportOptionalSubscript] | required files are not None
+    print(f'{masked.sidecar_name(mask_fn)} written')
+    prev_stats = masked.extract_stats(service, prev_fn, masked_extract_prev_year_folder)
+
+    mask_columns = mask_stats.columns
+    prev_columns = prev_stats.columns
+    mask_height = mask_stats.rows
+    prev_height = prev_stats.rows
+    min_filled_date = mask_stats.min_filled
+    max_filled_date = mask_stats.max_filled
+    sample = mask_stats.sample_frame()
+
+    print('-----')
+    print(f'comparing a:{mask_fn} and b:{prev_fn}...')
+    print('-----')
+    if mask_stats.schema_hash == prev_stats.schema_hash:
+        print('columns are equal')
+    elif set(mask_columns) == set(prev_columns):
+        print('columns are equal, but in a different order')
+    else:
+        print(f'columns only in a: {[col for col in mask_columns if col not in prev_columns]}')
+        print(f'columns only in b: {[col for col in prev_columns if col not in mask_columns]}')
+    print('-----')
+    print(f'{mask_fn} row count: {mask_height}')
+    print(f'{prev_fn} row count: {prev_height}')
+    percent_change = round((((mask_height - prev_height) / prev_height) * 100), 2)
+    print(f'percent change: {percent_change}')
+    print('-----')
+    print(f'{mask_fn} row count: {mask_height}')
+    print(f'{data_retention_fn} count: {dr_count}')
+    percent_dif = round((((mask_height - dr_count) / dr_count) * 100), 2)
+    print(f'percent difference: {percent_dif}')
+    print('-----')
+    print(f'{mask_fn} {min_filled_date = }')
+    print(f'{mask_fn} {max_filled_date = }')
+    print('-----')
+    sample.write_csv('data/mask_sample.csv')
+    print('data/mask_sample.csv updated')
+    if args.trend:
+        print('-----')
+        with pl.Config(tbl_rows=args.trend):
+            print(masked.trend(service, masked_extract_folder, current_month_date.replace(year=mask_year), args.trend))
+    if args.diff:
+        print('-----')
+        print(f'comparing rows of a:{mask_fn} and b:{prev_fn}...')
+        prev_extract = masked.find_file(service, prev_fn, masked_extract_prev_year_folder)
+        diff_counts = masked.diff_extracts(prev_extract['id'], mask_extract['id'], Path('data/mask_diff'), args.key)  # type: ignore[reportOptionalSubscript] | required files are not None
+        for result, count in diff_counts.items():
+            print(f'rows {result}: {count}')
+        print('data/mask_diff/ updated')
@@ -1,8 +1,25 @@
+from datetime import timedelta
+from pathlib import Path
 from zoneinfo import ZoneInfo
 
 MAX_SERVU_FILE_COUNT = 5                                    # the max number of files to keep on the servu
+DOWNLOAD_CHUNK_SIZE = 32 * 1024 ** 2                        # bytes per request when streaming a file from the google drive
 PHX_TZ = ZoneInfo('America/Phoenix')                        # phoenix timezone
 TOP_PRESCRIBERS = 40                                        # number of prescribers with the most dispensations and no searches for mandatory use reporting
 
 DAILY_DAYS_DELINQUENT_THRESHOLD = 2                         # min days delinquent to receive daily notices
 WEEKLY_DAYS_DELINQUENT_THRESHOLD = 7                        # min days delinquent to receive weekly notices
+DDS_EMAIL_LOG_MAX_ROWS = 50_000                             # rows in the dds email logs sheet before older rows are archived to parquet
+DDS_EMAIL_LOG_KEEP_ROWS = 10_000                            # newest rows kept in the dds email logs sheet after archiving
+DDS_HISTORY_DIR = Path('data/dds_history')                  # daily snapshots of the processed dds list, partitioned by run date
+
+CACHE_DIR = Path('data/cache')                              # local cache for snapshots of frequently downloaded files
+DEA_FILE = Path('data/cs_active.txt')                       # the dea registrants file, parsed by `deas.deas()`
+LIST_REQUEST_FILE = Path('data/List Request.csv')           # the igov list request export
+MANAGE_PHARMACIES_FILE = Path('data/pharmacies.csv')        # the awarxe manage pharmacies export
+TABLEAU_LUID_TTL = timedelta(days=30)                       # how long a cached tableau view luid is used before looking it up again
+TABLEAU_RESULT_TTL = timedelta(days=1)                      # how long a cached tableau view pull is used before pulling the view again
+TABLEAU_RESULT_CACHE_BYTES = 2 * 1024 ** 3                  # max size of the tableau view pull cache, least recently used pulls are removed first
+TABLEAU_REQUESTS_PER_SECOND = 2                             # max tableau view pulls per second across all threads
+GMAIL_SENDS_PER_SECOND = 2                                  # max gmail messages sent per second across all threads, under the per user quota
+MAIL_CHECKPOINT_DIR = CACHE_DIR / 'mail'                    # records of sent messages, so an interrupted run is not sent twice
@@ -0,0 +1,91 @@
+import argparse
+from datetime import date, datetime, timedelta
+
+import polars as pl
+
+from constants import DDS_HISTORY_DIR, PHX_TZ
+
+
+def append_snapshot(dds: pl.DataFrame, run_date: date) -> None:
+    """
+    saves a day's processed dds list to the history, replacing any earlier snapshot from the same day
+
+    args:
+        dds: the collected dds frame from `delinquent_data_submitters.process_input_files()`
+        run_date: the date of the run
+    """
+    partition = DDS_HISTORY_DIR / f'run_date={run_date.isoformat()}'
+    partition.mkdir(parents=True, exist_ok=True)
+    temp_path = partition / 'part.parquet.tmp'
+    dds.write_parquet(temp_path)
+    temp_path.replace(partition / 'part.parquet')
+
+
+def scan_history() -> pl.LazyFrame:
+    """
+    returns:
+        every saved dds snapshot, with a `run_date` column from the partition
+    """
+    return pl.scan_parquet(DDS_HISTORY_DIR / '**/*.parquet', hive_partitioning=True, hive_schema={'run_date': pl.Date}, missing_columns='insert')
+
+
+def days_on_list(start: date, end: date) -> pl.LazyFrame:
+    """
+    counts the runs each permit was on the dds list between two dates
+
+    args:
+        start: the first run date to include
+        end: the last run date to include
+
+    returns:
+        a lazyframe with one row per permit, the most days first
+    """
+    return (
+        scan_history()
+        .filter(
+            pl.col('run_date').is_between(start, end)
+        )
+        .group_by('Pharmacy License Number')
+        .agg(
+            pl.col('Business Name').last(),
+            pl.col('DEA').unique().sort().str.join(',').alias('deas'),
+            pl.col('run_date').n_unique().alias('days_on_list'),
+            pl.col('run_date').min().alias('first_seen'),
+            pl.col('run_date').max().alias('last_seen'),
+        )
+        .sort('days_on_list', 'Pharmacy License Number', descending=[True, False])
+    )
+
+
+def chronic_offenders(start: date, end: date, min_days: int) -> pl.LazyFrame:
+    """
+    finds permits that were on the dds list for at least `min_days` runs between two dates
+
+    args:
+        start: the first run date to include
+        end: the last run date to include
+        min_days: the min number of runs on the list
+
+    returns:
+        the rows of `days_on_list()` with at least `min_days`
+    """
+    return (
+        days_on_list(start, end)
+        .filter(
+            pl.col('days_on_list') >= min_days
+        )
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='report permits that are chronically on the dds list')
+    parser.add_argument('-d', '--days', type=int, default=90, help='number of days of history to check (default: %(default)s)')
+    parser.add_argument('-m', '--min-days', type=int, default=10, help='min days on the list to be reported (default: %(default)s)')
+    args = parser.parse_args()
+
+    today = datetime.now(tz=PHX_TZ).date()
+    offenders = chronic_offenders(today - timedelta(days=args.days), today, args.min_days).collect()
+    with pl.Config(tbl_rows=-1):
+        print(offenders)
+    offenders.write_csv('data/dds_chronic_offenders.csv')
+    print('data/dds_chronic_offenders.csv updated')
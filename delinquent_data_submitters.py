@@ -1,26 +1,58 @@
 import argparse
 import os
+import re
 import sys
+import time
 from calendar import FRIDAY, WEDNESDAY
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from io import BytesIO
 from pathlib import Path
-from typing import Literal
+from typing import TYPE_CHECKING, Literal
 
 import polars as pl
-from az_pmp_utils import auth, drive, email, files, num_and_dt
+from az_pmp_utils import drive, email, files, num_and_dt
 from dotenv import load_dotenv
-from googleapiclient import errors
-from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseUpload
 
+import cache
+import dds_history
+import mailer
+import services
+import sheets
 from constants import (
     DAILY_DAYS_DELINQUENT_THRESHOLD,
+    DDS_EMAIL_LOG_KEEP_ROWS,
+    DDS_EMAIL_LOG_MAX_ROWS,
+    LIST_REQUEST_FILE,
+    MAIL_CHECKPOINT_DIR,
+    MANAGE_PHARMACIES_FILE,
     PHX_TZ,
     WEEKLY_DAYS_DELINQUENT_THRESHOLD,
 )
 
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
 type EmailType = Literal['daily', 'friday']
 
 
+@contextmanager
+def timed(stage: str) -> Generator[None]:
+    """
+    prints how long a stage of the run took, even if it fails
+
+    args:
+        stage: the name of the stage
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        print(f'{stage} took {time.perf_counter() - start:.2f}s')
+
+
 def process_input_files(mp_path: Path, dds_path: Path, lr_path: Path) -> pl.LazyFrame:
     """
     process files, send email notifications, and update logs
@@ -34,12 +66,12 @@ def process_input_files(mp_path: Path, dds_path: Path, lr_path: Path) -> pl.Lazy
         processed dds file as a lazyframe
     """
     mp = (
-        pl.scan_csv(mp_path, infer_schema=False)
+        cache.manage_pharmacies(mp_path)
         .filter(
             pl.col('Reporting Requirements') != 'Exempt'
         )
         .select(
-            pl.col('DEA').str.strip_chars().str.to_uppercase(),
+            'DEA',
             'Pharmacy License Number',
             pl.col('Pharmacist Email').str.to_lowercase().alias('mp_email'),
             pl.col('Phone Number').alias('mp_phone')
@@ -47,13 +79,13 @@ def process_input_files(mp_path: Path, dds_path: Path, lr_path: Path) -> pl.Lazy
     )
 
     lr = (
-        pl.scan_csv(lr_path, infer_schema=False)
+        cache.list_request(lr_path)
         .filter(
             pl.col('Type') == 'Pharmacy',
             pl.col('Status').str.starts_with('OPEN')
         )
         .select(
-            pl.col('License/Permit #').str.strip_chars().str.to_uppercase().alias('Pharmacy License Number'),
+            pl.col('License/Permit #').alias('Pharmacy License Number'),
             'Status',
             'Business Name',
             'Street Address',
@@ -68,11 +100,8 @@ def process_input_files(mp_path: Path, dds_path: Path, lr_path: Path) -> pl.Lazy
     )
 
     complaints = (
-        drive.lazyframe_from_id_and_sheetname(os.environ['DDS_COMPLAINTS_FILE'], 'complaints', infer_schema_length=0)  # read_excel does not have infer_schema
-        .select(
-            'Pharmacy License Number',
-            'complaint_status'
-        )
+        sheets.read_sheet(os.environ['DDS_COMPLAINTS_FILE'], 'complaints', {'Pharmacy License Number': pl.String, 'complaint_status': pl.String})
+        .lazy()
         .filter(
             pl.col('complaint_status') == 'Open'
         )
@@ -93,7 +122,7 @@ def process_input_files(mp_path: Path, dds_path: Path, lr_path: Path) -> pl.Lazy
             'Pharmacy License Number',
             'Business Name',
             'Status',
-            (pl.col('Last Compliant').str.to_date('%Y-%m-%d') + pl.duration(days=1)).dt.to_string('%Y-%m-%d').alias('Last Compliant'),
+            (pl.col('Last Compliant').str.to_date('%Y-%m-%d') + pl.duration(days=1)).alias('Last Compliant'),
             'Days Delinquent',
             'Primary User',
             pl.concat_list(pl.col('Primary Email').str.to_lowercase(), pl.col('mp_email'), pl.col('igov_email')).list.unique().list.join(',').alias('to'),
@@ -112,7 +141,7 @@ def date_in_next_week(lf: pl.LazyFrame) -> pl.LazyFrame:
     filters a given lazyframe for rows with deadlines in the next business week (mon-fri)
 
     args:
-        lf: a lazyframe with a `deadline` column in `'YYYY-MM-DD` format
+        lf: a lazyframe with a `deadline` date column
 
     returns:
         the filtered lazyframe
@@ -124,7 +153,7 @@ def date_in_next_week(lf: pl.LazyFrame) -> pl.LazyFrame:
     return (
         lf
         .filter(
-            pl.col('deadline').str.to_date("%Y-%m-%d").is_between(next_mon, next_fri)
+            pl.col('deadline').is_between(next_mon, next_fri)
         )
     )
 
@@ -137,22 +166,22 @@ def send_notices(lf: pl.LazyFrame, email_type: EmailType) -> None:
         lf: a lazyframe with the dds recipients
         email_type: daily or friday notices
     """
-    service = build('gmail', 'v1', credentials=auth.auth())
-    timestamps = []
-    notices = lf.sort(pl.col('Last Compliant').str.to_date("%Y-%m-%d")).collect()
+    notices = lf.sort('Last Compliant').collect()
 
     if args.send_emails:
         sanity_check = input(f'{notices.height} notices to be sent, does this make sense? (y/n): ')
         if sanity_check != 'y':
             sys.exit('no notices sent, verify data with vendor')
 
+    messages = {}
+    keys = []
     for row in notices.iter_rows(named=True):
         pharmacy_address = f'{row['Street Address']}, {row['Apt/Suite #']}\n{row['City']}, {row['State']} {row['Zip'][1:]}' if row['Apt/Suite #'] else f'{row['Street Address']}\n{row['City']}, {row['State']} {row['Zip'][1:]}'
         if row['Last Compliant'] is not None:
-            if row['Last Compliant'] == (datetime.now(tz=PHX_TZ).date() - timedelta(days=2)).strftime('%Y-%m-%d'):
-                last_compliant = row['Last Compliant']
+            if row['Last Compliant'] == datetime.now(tz=PHX_TZ).date() - timedelta(days=2):
+                last_compliant = f'{row['Last Compliant']:%Y-%m-%d}'
             else:
-                last_compliant = f'{row['Last Compliant']} - {(datetime.now(tz=PHX_TZ).date() - timedelta(days=2)).strftime('%Y-%m-%d')}'
+                last_compliant = f'{row['Last Compliant']:%Y-%m-%d} - {datetime.now(tz=PHX_TZ).date() - timedelta(days=2):%Y-%m-%d}'
         else:
             last_compliant = 'no data has ever been received'
 
@@ -171,7 +200,7 @@ At this time, you are in violation of <a href="https://www.azleg.gov/ars/36/0260
 
 <b>Zero reports should be submitted for any days there are no controlled substance dispensations. For days you are not operational, you should report zero for those days on your next open business day.</b>
 
-<b style='color: red;'>Please ensure you upload your missed submissions by {row['deadline'][1:]} or a complaint will be opened against the pharmacy permit. </b>
+<b style='color: red;'>Please ensure you upload your missed submissions by {row['deadline']:%Y-%m-%d} or a complaint will be opened against the pharmacy permit. </b>
 
 If your pharmacy has an active DEA number, an active AZ pharmacy permit, and is not limited to veterinary dispensing, <em><b>it is required to submit a daily report, including zero reports, for controlled substances II-V.</b></em>
 
@@ -199,7 +228,11 @@ If you have any questions or concerns about the data submission process, please
 <a href="https://drive.google.com/file/d/1R1wCymw9T5n2sqn8fQGuWeEoCChXmjB0/view?ts=67ca02cd" target="_blank">AZ Data Submission Dispenser Guide</a>
 <a href="https://pharmacypmp.az.gov/data-submissions-faqs" target="_blank">AZ Data Submission FAQs</a>{os.environ['EMAIL_COMP_SIG'].replace(r'\n', '\n')}
             """
-        msg = email.EmailMessage(
+        key = f'{row['Pharmacy License Number']} | {row['DEA']} | {row['to']}'
+        if key in messages:
+            key = f'{key} | {len(keys)}'
+        keys.append(key)
+        messages[key] = email.EmailMessage(
             sender=os.environ['EMAIL_COMPLIANCE'],
             to=row['to'],
             bcc=os.environ['EMAIL_COMPLIANCE'],
@@ -207,24 +240,32 @@ If you have any questions or concerns about the data submission process, please
             message_text=body,
             monospace=True,
         )
-        try:
-            email.send_email(msg, service=service, draft=(not args.send_emails))
-            ts = datetime.now(tz=PHX_TZ)
-        except errors.HttpError as error:
-            print(f'failed to send message for {row['Pharmacy License Number']} | {row['DEA']}:')
-            print(f'error: {error!s}')
-            print('`sent_dt` will be left blank')
-            ts = None
-        timestamps.append(ts)
-
-    print(f'{len(timestamps)} {'emails sent' if args.send_emails else 'drafts created'}')
+
+    sent = mailer.send_all(messages, draft=(not args.send_emails), checkpoint=MAIL_CHECKPOINT_DIR / f'dds_{email_type}_{datetime.now(tz=PHX_TZ).date()}.jsonl')
+    log_notices(notices, keys, sent, email_type)
+
+
+def log_notices(notices: pl.DataFrame, keys: list[str], sent: dict[str, datetime | None], email_type: EmailType) -> None:
+    """
+    appends the notices sent in this run to the dds email logs sheet, messages skipped because a same day run already sent them are not logged again
+
+    args:
+        notices: the notices, one row per key
+        keys: the message key of each row of `notices`
+        sent: the sent times returned by `mailer.send_all()`
+        email_type: daily or friday notices
+    """
+    notices = notices.filter(pl.Series([key in sent for key in keys]))
+    timestamps = [sent[key] for key in keys if key in sent]
+    failed = sum(ts is None for ts in timestamps)
+    if failed:
+        print(f'{failed} messages failed, `sent_dt` will be left blank for them')
+    print(f'{len(timestamps) - failed} {'emails sent' if args.send_emails else 'drafts created'}')
+    if not timestamps:
+        return
     ts_series = pl.Series(name='sent_dt', values=timestamps, dtype=pl.Datetime)
     notices.insert_column(0, ts_series)
 
-    logs = (
-        drive.lazyframe_from_id_and_sheetname(os.environ['DDS_EMAIL_LOGS_FILE'], 'dds_email_logs', infer_schema_length=0)  # read_excel does not have infer_schema
-        .collect()
-    )
     new_dds_log = (
         notices
         .select(
@@ -237,114 +278,207 @@ If you have any questions or concerns about the data submission process, please
             pl.lit(email_type).alias('email_type')
         )
     )
-    full_logs = pl.concat([logs, new_dds_log])
-    fl_path = Path('full_logs.csv')
-    full_logs.write_csv(fl_path)
-    drive.update_sheet(fl_path, os.environ['DDS_EMAIL_LOGS_FILE'], sheet_name='dds_email_logs')
-    fl_path.unlink()
+    if append_email_log(new_dds_log) > DDS_EMAIL_LOG_MAX_ROWS:
+        roll_over_email_log()
 
 
-def missed_deadlines_to_complaint(deadlines: pl.LazyFrame) -> pl.DataFrame | None:
+def append_email_log(new_dds_log: pl.DataFrame) -> int:
     """
-    moves pharmacies who have missed their deadline to the complaints sheet and generates required documents
+    appends rows to the end of the dds email logs sheet in one request, without reading the sheet
+    values are written as RAW strings, so sheets does not turn dates into date cells or drop leading zeros from permit numbers
 
     args:
-        deadlines: a lazyframe of the deadlines sheet
+        new_dds_log: the rows to append, in the same column order as the sheet
 
     returns:
-        a dataframe with the pharmacies that have been added to the complaint sheet,
-        or None if no pharmacies were added
+        the row number of the last row in the sheet after appending
     """
-    today = datetime.now(tz=PHX_TZ).date()
-    missed_dl = (
-        deadlines
-        .filter(
-            pl.col('deadline').str.to_date('%Y-%m-%d') < today
-        )
-        .collect()
-    )
+    result = services.sheets().spreadsheets().values().append(
+        spreadsheetId=os.environ['DDS_EMAIL_LOGS_FILE'],
+        range='dds_email_logs!A:A',
+        valueInputOption='RAW',
+        insertDataOption='INSERT_ROWS',
+        body={'values': new_dds_log.select(pl.all().cast(pl.String).fill_null('')).rows()},
+    ).execute()
+    updated_range = result['updates']['updatedRange']
+    print(f'{new_dds_log.height} rows appended to dds_email_logs')
+    return int(re.search(r'(\d+)$', updated_range).group(1))  # type: ignore[reportOptionalMemberAccess] | updatedRange always ends in a row number
+
+
+def archive_email_log_rows(logs_id: str, header: list[str], rows: list[list[str]]) -> str:
+    """
+    writes rows of the dds email logs sheet to a parquet file in the same google drive folder as the sheet
 
-    not_missed = (
-        deadlines
-        .filter(
-            pl.col('deadline').str.to_date('%Y-%m-%d') >= today
-        )
-        .collect()
+    args:
+        logs_id: the id of the dds email logs sheet
+        header: the header row of the sheet
+        rows: the rows to archive, as returned by `values().get()`
+
+    returns:
+        the name of the archive
+    """
+    drive_service = services.drive()
+    archive = pl.DataFrame(
+        [row + [''] * (len(header) - len(row)) for row in rows],
+        schema=dict.fromkeys(header, pl.String),
+        orient='row',
     )
+    archive_buffer = BytesIO()
+    archive.write_parquet(archive_buffer)
+    archive_buffer.seek(0)
+    archive_name = f'dds_email_logs_archived_{datetime.now(tz=PHX_TZ).strftime('%Y%m%d_%H%M%S')}.parquet'
+
+    logs_folder = drive_service.files().get(fileId=logs_id, fields='parents', supportsAllDrives=True).execute()['parents'][0]
+    file_metadata = {
+        'name': archive_name,
+        'parents': [logs_folder],
+    }
+    media = MediaIoBaseUpload(archive_buffer, mimetype='application/vnd.apache.parquet')
+    drive_service.files().create(supportsAllDrives=True, media_body=media, body=file_metadata).execute()
+    return archive_name
+
+
+def roll_over_email_log() -> None:
+    """
+    archives all but the newest `DDS_EMAIL_LOG_KEEP_ROWS` rows of the dds email logs sheet with `archive_email_log_rows()`,
+    then deletes the archived rows from the sheet
+    """
+    print('rolling over dds_email_logs...')
+    logs_id = os.environ['DDS_EMAIL_LOGS_FILE']
+    sheets_service = services.sheets()
+
+    values = sheets_service.spreadsheets().values().get(spreadsheetId=logs_id, range='dds_email_logs').execute()['values']
+    header, rows = values[0], values[1:]
+    archive_count = len(rows) - DDS_EMAIL_LOG_KEEP_ROWS
+    if archive_count <= 0:
+        return
+    archive_name = archive_email_log_rows(logs_id, header, rows[:archive_count])
+    print(f'{archive_count} rows archived to {archive_name}')
+
+    spreadsheet = sheets_service.spreadsheets().get(spreadsheetId=logs_id, fields='sheets.properties').execute()
+    sheet_id = next(sheet['properties']['sheetId'] for sheet in spreadsheet['sheets'] if sheet['properties']['title'] == 'dds_email_logs')
+    delete_rows = {
+        'deleteDimension': {
+            'range': {
+                'sheetId': sheet_id,
+                'dimension': 'ROWS',
+                'startIndex': 1,
+                'endIndex': 1 + archive_count,
+            }
+        }
+    }
+    sheets_service.spreadsheets().batchUpdate(spreadsheetId=logs_id, body={'requests': [delete_rows]}).execute()
+    print(f'{archive_count} rows removed from dds_email_logs')
+
+
+def write_deadlines(deadlines: pl.DataFrame) -> None:
+    """
+    replaces the contents of the dds deadlines sheet on the pooled sheets service, instead of uploading a csv through `drive.update_sheet()`
+    dates are written as `YYYY-MM-DD`
+
+    args:
+        deadlines: the deadlines, with the columns of the sheet
+    """
+    deadlines_id = os.environ['DDS_DEADLINES_FILE']
+    values = services.sheets().spreadsheets().values()
+    values.clear(spreadsheetId=deadlines_id, range='dds_deadlines').execute()
+    values.update(
+        spreadsheetId=deadlines_id,
+        range='dds_deadlines!A1',
+        valueInputOption='RAW',
+        body={'values': [deadlines.columns, *deadlines.select(pl.all().cast(pl.String).fill_null('')).rows()]},
+    ).execute()
+    print(f'{deadlines.height} rows written to dds_deadlines')
+
+
+def missed_deadlines_to_complaint(deadlines: pl.DataFrame) -> tuple[pl.DataFrame | None, pl.DataFrame]:
+    """
+    moves pharmacies who have missed their deadline to the complaints sheet and generates required documents
+
+    args:
+        deadlines: the deadlines sheet, with `deadline` and `Last Compliant` parsed to dates
+
+    returns:
+        a dataframe with the pharmacies that have been added to the complaint sheet, or None if no pharmacies were added,
+        and the deadlines that remain on the deadlines sheet
+    """
+    today = datetime.now(tz=PHX_TZ).date()
+    is_missed = (deadlines['deadline'] < today).fill_null(value=False)  # rows without a deadline stay on the sheet
+    missed_dl = deadlines.filter(is_missed)
+    not_missed = deadlines.filter(~is_missed)
 
     if missed_dl.height > 0:
         print('missed deadlines:')
         print(missed_dl)
         print('moving to dds_complaints...')
 
-        folder_ids = []
         dds_compaints_sheet_id = os.environ['DDS_COMPLAINTS_FILE']
-        for row in missed_dl.iter_rows(named=True):
-            complaint_folder_id = drive.folder_id_from_name(folder_name=row['Business Name'] + '-' + row['Pharmacy License Number'], parent_folder_id=os.environ['PHARMACY_REPORTING_COMPLAINTS_FOLDER'], create=True)
-            folder_ids.append(complaint_folder_id)
-            complaint_folder_link = f'https://drive.google.com/drive/folders/{complaint_folder_id}'
-            print(f'{complaint_folder_link = }')
-
-            service = build('sheets', 'v4', credentials=auth.auth())
-            result = service.spreadsheets().values().get(spreadsheetId=dds_compaints_sheet_id, range='complaints!A:A').execute()
-            values = result.get('values', [])
 
-            last_row = len(values) if values else 1
+        def complaint_folder(folder_name: str) -> str:
+            return drive.folder_id_from_name(service=services.drive(), folder_name=folder_name, parent_folder_id=os.environ['PHARMACY_REPORTING_COMPLAINTS_FOLDER'], create=True)
 
-            data = [complaint_folder_link, '', '', '', '', '']
-            data.extend(list(row.values()))
-            data_range = f'complaints!A{last_row + 1}'
+        # one lookup per unique folder, so rows for the same pharmacy can not race to create duplicate folders
+        folder_names = [row['Business Name'] + '-' + row['Pharmacy License Number'] for row in missed_dl.iter_rows(named=True)]
+        unique_names = list(dict.fromkeys(folder_names))
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            name_ids = dict(zip(unique_names, executor.map(complaint_folder, unique_names), strict=True))
+        folder_ids = [name_ids[folder_name] for folder_name in folder_names]
 
-            service.spreadsheets().values().update(
-                spreadsheetId=dds_compaints_sheet_id,
-                range=data_range,
-                valueInputOption='RAW',
-                body={'values': [data]}
-            ).execute()
+        complaint_rows = []
+        for row, complaint_folder_id in zip(missed_dl.select(pl.all().cast(pl.String)).iter_rows(named=True), folder_ids, strict=True):  # dates are written as `YYYY-MM-DD`
+            complaint_folder_link = f'https://drive.google.com/drive/folders/{complaint_folder_id}'
+            print(f'{complaint_folder_link = }')
+            complaint_rows.append([complaint_folder_link, '', '', '', '', '', *row.values()])
 
-            print(f'updated dds_complaints: https://docs.google.com/spreadsheets/d/{dds_compaints_sheet_id}')
+        services.sheets().spreadsheets().values().append(
+            spreadsheetId=dds_compaints_sheet_id,
+            range='complaints!A:A',
+            valueInputOption='RAW',
+            body={'values': complaint_rows}
+        ).execute()
+        print(f'updated dds_complaints: https://docs.google.com/spreadsheets/d/{dds_compaints_sheet_id}')
 
-        fl_path = Path('temp_csv.csv')
-        not_missed.write_csv(fl_path)
-        drive.update_sheet(fl_path, os.environ['DDS_DEADLINES_FILE'], sheet_name='dds_deadlines')
-        fl_path.unlink()
-        return missed_dl.with_columns(pl.Series('folder_id', folder_ids))
+        write_deadlines(not_missed)
+        return missed_dl.with_columns(pl.Series('folder_id', folder_ids)), not_missed
 
     print('no missed deadlines')
-    return None
+    return None, not_missed
 
 
 def generate_complaint_docs(new_complaints: pl.DataFrame) -> None:
     """
     adds the complaint docs to the folder created in `missed_deadlines_to_complaint`
+    copies whose placeholders could not be replaced are deleted, then the first error from either batch is re-raised, usually an `HttpError`
 
     args:
         new_complaints: the df returned by `missed_deadlines_to_complaint`
     """
     print('generating complaint docs...')
-    creds = auth.auth()
-    docs_service = build('docs', 'v1', credentials=creds)
-    drive_service = build('drive', 'v3', credentials=creds)
-
-    for row in new_complaints.iter_rows(named=True):
-        res = 'resident' if row['State'] == 'AZ' else 'non-resident'
-        address = f'{row['Street Address']}\n{row['Apt/Suite #']}' if row['Apt/Suite #'] else row['Street Address']
+    docs_service = services.docs()
+    drive_service = services.drive()
 
-        complaint_summary_id = drive_service.files().copy(
+    copies = {}
+    for i, row in enumerate(new_complaints.iter_rows(named=True)):
+        copies[f'{i}-summary'] = drive_service.files().copy(
             fileId=os.environ['DDS_COMPLAINT_SUMMARY_FILE'],
             body={
                 'name': f'{row['Business Name']} Complaint Summary',
                 'parents': [row['folder_id']]
             }, supportsAllDrives=True
-         ).execute()['id']
-
-        notice_of_complaint_id = drive_service.files().copy(
+         )
+        copies[f'{i}-notice'] = drive_service.files().copy(
             fileId=os.environ['DDS_NOTICE_OF_COMPLAINT_FILE'],
             body={
                 'name': f'{row['Business Name']} Notice of Complaint',
                 'parents': [row['folder_id']]
             }, supportsAllDrives=True
-         ).execute()['id']
+         )
+    copied, copy_errors = services.execute_batch_results(drive_service, copies)
+
+    updates = {}
+    for i, row in enumerate(new_complaints.iter_rows(named=True)):
+        res = 'resident' if row['State'] == 'AZ' else 'non-resident'
+        address = f'{row['Street Address']}\n{row['Apt/Suite #']}' if row['Apt/Suite #'] else row['Street Address']
 
         requests = [
             {
@@ -391,100 +525,109 @@ def generate_complaint_docs(new_complaints: pl.DataFrame) -> None:
             },
         ]
 
-        docs_service.documents().batchUpdate(documentId=complaint_summary_id, body={'requests': requests}).execute()
-        docs_service.documents().batchUpdate(documentId=notice_of_complaint_id, body={'requests': requests}).execute()
+        for doc in ('summary', 'notice'):
+            if f'{i}-{doc}' in copied:
+                updates[f'{i}-{doc}'] = docs_service.documents().batchUpdate(documentId=copied[f'{i}-{doc}']['id'], body={'requests': requests})
+    _, update_errors = services.execute_batch_results(docs_service, updates)
+
+    if update_errors:  # remove copies that still have the template placeholders instead of leaving them in the complaint folders
+        deletes = {doc_id: drive_service.files().delete(fileId=copied[doc_id]['id'], supportsAllDrives=True) for doc_id in update_errors}
+        services.execute_batch(drive_service, deletes)
+    print(f'{len(copied) - len(update_errors)} complaint docs generated')
+
+    errors = copy_errors | update_errors
+    if errors:
+        print(f'{len(errors)} complaint docs failed: {', '.join(errors)}')
+        first_error = next(iter(errors.values()))
+        raise first_error
 
 
 def pharm_clean(dds: pl.LazyFrame) -> None:
     """
     takes the proper action for the delinquent data submitters process based on the day of the week
+    each input is read and parsed once, and the materialized frames are passed between the stages
 
     args:
         dds: the dds lazyframe returned by `process_input_files()`
     """
     today = datetime.now(tz=PHX_TZ).date()
 
-    if today.weekday() == WEDNESDAY:  # notify compliance team of deadlines that fall in the next week
-        deadlines = (
-            drive.lazyframe_from_id_and_sheetname(os.environ['DDS_DEADLINES_FILE'], 'dds_deadlines', infer_schema_length=0)  # read_excel does not have infer_schema
-            .cast({pl.Null: pl.String})
-        )
+    if today.weekday() in {WEDNESDAY, FRIDAY}:
+        with timed('read inputs'):
+            deadlines_lf = (
+                cache.sheet(os.environ['DDS_DEADLINES_FILE'], 'dds_deadlines', infer_schema_length=0)  # read_excel does not have infer_schema
+                .cast({pl.Null: pl.String})
+                .with_columns(
+                    pl.col('deadline', 'Last Compliant').str.to_date('%Y-%m-%d')  # parsed once here, later stages compare dates and `write_deadlines()` formats them
+                )
+            )
+            dds_df, deadlines = pl.collect_all([dds, deadlines_lf])
 
-        new_complaints = missed_deadlines_to_complaint(deadlines)
+        with timed('missed deadlines'):
+            new_complaints, deadlines = missed_deadlines_to_complaint(deadlines)
         if new_complaints is not None:
-            generate_complaint_docs(new_complaints)
-
-        due_next_week = date_in_next_week(deadlines).collect()
-        if due_next_week.height > 0:
-            msg = f'the following pharmacies have deadlines next week:\n{'\n'.join(f'permit: {item[0]} deadline: {item[1]}' for item in zip(due_next_week['Pharmacy License Number'].to_list(), due_next_week['deadline'].to_list(), strict=True))}\ncomplaints should be opened if the deadlines are missed\n\nthank you!'
-        else:
-            msg = 'no pharmacies have deadlines next week\n\nthank you!'
-        dnw_msg = email.EmailMessage(
-            sender=os.environ['EMAIL_COMPLIANCE'],
-            to=os.environ['EMAIL_COMPLIANCE'],
-            subject=f'DDS Pharmacies with Deadlines Next Week - {today.strftime('%Y-%m-%d')}',
-            message_text=msg,
-            monospace=True
-        )
-        email.send_email(dnw_msg, draft=(not args.send_emails))
-
-    if today.weekday() == FRIDAY:  # add new pharmacies to the deadlines list and apply deadline
-        due_date = num_and_dt.add_business_days(today)
-        deadlines = (
-            drive.lazyframe_from_id_and_sheetname(os.environ['DDS_DEADLINES_FILE'], 'dds_deadlines', infer_schema_length=0)  # read_excel does not have infer_schema
-            .cast({pl.Null: pl.String})
-        )
+            with timed('complaint docs'):
+                generate_complaint_docs(new_complaints)
+    else:
+        with timed('read inputs'):
+            dds_df = dds.collect()
+    dds_history.append_snapshot(dds_df.with_columns(pl.col('Last Compliant').dt.to_string('%Y-%m-%d')), today)  # keep the snapshot schema of earlier runs
 
-        new_complaints = missed_deadlines_to_complaint(deadlines)
-        if new_complaints is not None:
-            generate_complaint_docs(new_complaints)
-            deadlines = (
-                drive.lazyframe_from_id_and_sheetname(os.environ['DDS_DEADLINES_FILE'], 'dds_deadlines', infer_schema_length=0)  # read_excel does not have infer_schema
-                .cast({pl.Null: pl.String})
+    if today.weekday() == WEDNESDAY:  # notify compliance team of deadlines that fall in the next week
+        with timed('deadlines next week'):
+            due_next_week = date_in_next_week(deadlines.lazy()).collect()
+            if due_next_week.height > 0:
+                msg = f'the following pharmacies have deadlines next week:\n{'\n'.join(f'permit: {item[0]} deadline: {item[1]}' for item in zip(due_next_week['Pharmacy License Number'].to_list(), due_next_week['deadline'].to_list(), strict=True))}\ncomplaints should be opened if the deadlines are missed\n\nthank you!'
+            else:
+                msg = 'no pharmacies have deadlines next week\n\nthank you!'
+            dnw_msg = email.EmailMessage(
+                sender=os.environ['EMAIL_COMPLIANCE'],
+                to=os.environ['EMAIL_COMPLIANCE'],
+                subject=f'DDS Pharmacies with Deadlines Next Week - {today.strftime('%Y-%m-%d')}',
+                message_text=msg,
+                monospace=True
             )
+            email.send_email(dnw_msg, service=services.gmail(), draft=(not args.send_emails))
 
-        new_deadlines = (
-            dds
-            .filter(
-                (pl.col('Days Delinquent').str.to_integer() >= WEEKLY_DAYS_DELINQUENT_THRESHOLD) |
-                (pl.col('Days Delinquent') == '') |  # noqa: PLC1901 | empty string is not falsey in polars
-                (pl.col('Days Delinquent').is_null())
-            )
-            .join(deadlines, on='Pharmacy License Number', how='anti')
-        )
-        if new_deadlines.collect().height > 0:
+    if today.weekday() == FRIDAY:  # add new pharmacies to the deadlines list and apply deadline
+        with timed('update deadlines'):
+            due_date = num_and_dt.add_business_days(today)
             new_deadlines = (
-                new_deadlines
-                .drop('Days Delinquent')
-                .with_columns(
-                    pl.lit(due_date).dt.to_string('%Y-%m-%d').alias('deadline')
+                dds_df
+                .filter(
+                    (pl.col('Days Delinquent').str.to_integer() >= WEEKLY_DAYS_DELINQUENT_THRESHOLD) |
+                    (pl.col('Days Delinquent') == '') |  # noqa: PLC1901 | empty string is not falsey in polars
+                    (pl.col('Days Delinquent').is_null())
                 )
+                .join(deadlines, on='Pharmacy License Number', how='anti')
             )
-            deadlines = pl.concat([deadlines, new_deadlines])
+            if new_deadlines.height > 0:
+                new_deadlines = (
+                    new_deadlines
+                    .drop('Days Delinquent')
+                    .with_columns(
+                        pl.lit(due_date).cast(pl.Date).alias('deadline')
+                    )
+                )
+                deadlines = pl.concat([deadlines, new_deadlines])
 
-        deadlines_path = Path('deadlines.csv')
-        deadlines.collect().write_csv(deadlines_path)
-        drive.update_sheet(deadlines_path, os.environ['DDS_DEADLINES_FILE'], 'dds_deadlines')
-        deadlines_path.unlink()
+            write_deadlines(deadlines)
 
-        send_notices(deadlines, 'friday')
+        with timed('send notices'):
+            send_notices(deadlines.lazy(), 'friday')
     else:
-        send_notices(dds, 'daily')
+        with timed('send notices'):
+            send_notices(dds_df.lazy(), 'daily')
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='delinquent data submitters')
     parser.add_argument('-s', '--send-emails', action='store_true', help='send emails instead of creating drafts')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='number of complaint folders to look up or create at once (default: %(default)s)')
     args = parser.parse_args()
     load_dotenv()
-    mp_path = Path('data/pharmacies.csv')
-    files.warn_file_age(mp_path)
-
     dds_path = Path('data/DelinquentDispenserRequest.csv')
     files.warn_file_age(dds_path)
 
-    lr_path = Path('data/List Request.csv')
-    files.warn_file_age(lr_path)
-
-    dds = process_input_files(mp_path, dds_path, lr_path)
+    dds = process_input_files(MANAGE_PHARMACIES_FILE, dds_path, LIST_REQUEST_FILE)
     pharm_clean(dds)
@@ -1,13 +1,15 @@
 import argparse
+import contextlib
 import os
+import sys
 from datetime import date, datetime, timedelta
-from io import BytesIO
 
 import paramiko
-from az_pmp_utils import drive
 from dotenv import load_dotenv
+from googleapiclient.http import MediaIoBaseDownload
 
-from constants import MAX_SERVU_FILE_COUNT, PHX_TZ
+import services
+from constants import DOWNLOAD_CHUNK_SIZE, MAX_SERVU_FILE_COUNT, PHX_TZ
 
 
 def get_last_sunday() -> date:
@@ -25,11 +27,12 @@ def get_last_sunday() -> date:
 def remove_oldest_file(sftp: paramiko.SFTPClient) -> None:
     """
     removes the oldest file from the current folder in the sftp; maintains the `MAX_SERVU_FILE_COUNT` on the server
+    partial `.part` uploads are not counted
 
     args:
         sftp: paramiko SFTPClient
     """
-    files = sftp.listdir_attr()
+    files = [f for f in sftp.listdir_attr() if not f.filename.endswith('.part')]
     if len(files) > MAX_SERVU_FILE_COUNT:
         oldest_file = min(files, key=lambda f: f.st_mtime)  # type: ignore[reportArgumentType] | these files will have st_mtime
         print(f'removing oldest file: {oldest_file.filename}...')
@@ -39,9 +42,29 @@ def remove_oldest_file(sftp: paramiko.SFTPClient) -> None:
         print(f'{MAX_SERVU_FILE_COUNT} files on servu, none removed')
 
 
+def stream_to_sftp(service, file_id: str, sftp: paramiko.SFTPClient, remote_name: str) -> None:  # noqa: ANN001 | service is dynamically typed
+    """
+    streams a file from the google drive to the sftp in chunks of `DOWNLOAD_CHUNK_SIZE`
+
+    args:
+        service: an authorized google drive service
+        file_id: the id of the file on the google drive
+        sftp: paramiko SFTPClient
+        remote_name: the name to write the file to on the sftp
+    """
+    with sftp.file(remote_name, 'wb') as remote_file:
+        remote_file.set_pipelined(True)
+        downloader = MediaIoBaseDownload(remote_file, service.files().get_media(fileId=file_id, supportsAllDrives=True), chunksize=DOWNLOAD_CHUNK_SIZE)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk(num_retries=3)
+            print(f'{status.progress():.0%} uploaded', end='\r')
+
+
 def upload_latest_dhs_file(sftp: paramiko.SFTPClient, folder: str) -> None:
     """
     uploads the latest standard extract to the DHS sftp
+    the extract is streamed from the google drive to a temporary file on the sftp in chunks, then renamed once its size is verified
 
     args:
         sftp: paramiko SFTPClient connected to the DHS sftp
@@ -53,12 +76,33 @@ def upload_latest_dhs_file(sftp: paramiko.SFTPClient, folder: str) -> None:
 
     if file_name not in files:
         print(f'{file_name} not found, uploading...')
-        extract = drive.lazyframe_from_file_name(file_name=file_name, folder_id=folder, drive_ft='csv', separator='|', infer_schema=False)
-        csv_buffer = BytesIO()
-        extract.collect().write_csv(csv_buffer, separator='|')
-        csv_buffer.seek(0)
+        service = services.drive()
+        results = service.files().list(q=f"name = '{file_name}' and '{folder}' in parents and trashed = false",
+                                       supportsAllDrives=True,
+                                       includeItemsFromAllDrives=True,
+                                       orderBy='modifiedTime desc',
+                                       fields='files(id, size)').execute()
+        extracts = results.get('files', [])
+        if not extracts:
+            sys.exit(f'{file_name} not found on the google drive')
+        extract = extracts[0]
+
+        temp_name = f'{file_name}.part'
         print(f'writing {file_name} to sftp...')
-        sftp.putfo(csv_buffer, remotepath=file_name)
+        try:
+            stream_to_sftp(service, extract['id'], sftp, temp_name)
+        except BaseException:
+            # do not leave a partial upload on the server, if the connection is gone the next run overwrites it
+            with contextlib.suppress(OSError, paramiko.SSHException):
+                sftp.remove(temp_name)
+            raise
+        print()
+
+        remote_size = sftp.stat(temp_name).st_size
+        if remote_size != int(extract['size']):
+            sftp.remove(temp_name)
+            sys.exit(f'{file_name} is {remote_size} bytes on the sftp, but {extract['size']} bytes on the google drive; upload removed')
+        sftp.rename(temp_name, file_name)
         print('file uploaded')
     else:
         print(f'{file_name} found, no upload yet')
@@ -2,12 +2,12 @@ import os
 from pathlib import Path
 from typing import Any
 
-import google.auth.external_account_authorized_user
-import google.oauth2.credentials
 import polars as pl
-from az_pmp_utils import auth, drive, tableau
+from az_pmp_utils import drive
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
+
+import cache
+import services
 
 
 def pull_file() -> pl.LazyFrame:
@@ -18,8 +18,8 @@ def pull_file() -> pl.LazyFrame:
         top_pharmacy: a LazyFrame containing the top pharmacies errors
     """
     print('pulling error file from tableau...')
-    luid = tableau.find_view_luid(view_name='Errors by Pharmacy', workbook_name='Pharmacy Compliance')
-    errors_lf = tableau.lazyframe_from_view_id(view_id=luid, infer_schema_length=10000)
+    luid = cache.find_view_luid(view_name='Errors by Pharmacy', workbook_name='Pharmacy Compliance')
+    errors_lf = cache.lazyframe_from_view_id(view_id=luid, infer_schema_length=10000)
 
     errors_by_pharmacy = (
         errors_lf
@@ -70,12 +70,12 @@ def row_for_sheet(top_pharmacy: pl.LazyFrame, folder_id: str) -> list[Any]:
         returns the rows as a list in an organized fashion to match the columns on the google sheet
     """
     igov = (
-        pl.scan_csv('data/List Request.csv', infer_schema=False)
+        cache.list_request()
         .filter(
             pl.col('Type') == 'Pharmacy'
         )
         .with_columns(
-            pl.col('License/Permit #').str.to_uppercase().str.strip_chars().alias('license'),
+            pl.col('License/Permit #').alias('license'),
             pl.concat_str(
                     [
                         pl.col('Street Address'),
@@ -122,19 +122,18 @@ def row_for_sheet(top_pharmacy: pl.LazyFrame, folder_id: str) -> list[Any]:
     )
 
 
-def update_error_sheet(creds: google.oauth2.credentials.Credentials | google.auth.external_account_authorized_user.Credentials, row_for_updating: list[Any], file_id: str) -> None:
+def update_error_sheet(row_for_updating: list[Any], file_id: str) -> None:
     """
     adds a given row to the end of the pharmacy error sheet
 
     args:
-        creds: credentials from `auth.auth()`
         row_for_updating: a list containing the row for adding to the end of the pharmacy error sheet
         file_id: the file id of the pharmacy error sheet
     """
     print('getting error sheet from drive...')
     range_name = 'errors!A:A'
-    service = build('sheets', 'v4', credentials=creds)
-    result = service.spreadsheets().values().get(spreadsheetId=error_sheet_id, range=range_name).execute()
+    service = services.sheets()
+    result = service.spreadsheets().values().get(spreadsheetId=file_id, range=range_name).execute()
     values = result.get('values', [])
     last_row = len(values) if values else 1
     data_range = f'errors!A{last_row + 1}:K{last_row + 1}'
@@ -154,8 +153,7 @@ if __name__ == '__main__':
     error_sheet_id = os.environ['PHARMACY_CORRECTIONS_FILE']
     error_folder_id = os.environ['ERROR_CORRECTIONS_FOLDER']
 
-    creds = auth.auth()
-    service = build('drive', 'v3', credentials=creds)
+    service = services.drive()
     top_pharmacy = pull_file()
     top_pharmacy_name = (top_pharmacy.select(pl.col('pharmacy')).collect().head(1).item())
     folder_id = drive.folder_id_from_name(service, top_pharmacy_name, error_folder_id, create=True)
@@ -164,4 +162,4 @@ if __name__ == '__main__':
     Path(file_name).unlink()
     print(f'{file_name} removed')
     row_for_updating = row_for_sheet(top_pharmacy, folder_id)
-    update_error_sheet(creds, row_for_updating, error_sheet_id)
+    update_error_sheet(row_for_updating, error_sheet_id)
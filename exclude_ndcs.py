@@ -1,21 +1,20 @@
 import os
 
 import polars as pl
-from az_pmp_utils import auth, drive, tableau
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 
-creds = auth.auth()
-service = build('drive', 'v3', credentials=creds)
+import cache
+import services
+import sheets
 
 load_dotenv()
 
 sheet_id = os.environ['EXCLUDED_NDCS_FILE']
 
-excluded_ndcs = drive.lazyframe_from_id_and_sheetname(sheet_id, 'excluded', service=service, infer_schema_length=0)  # read_excel does not have infer_schema
+excluded_ndcs = sheets.read_sheet(sheet_id, 'excluded', {'NDC': pl.String}).lazy()
 
-luid = tableau.find_view_luid('opiate_antagonists', 'opiate antagonists')
-lf = tableau.lazyframe_from_view_id(luid, infer_schema=False)
+luid = cache.find_view_luid('opiate_antagonists', 'opiate antagonists')
+lf = cache.lazyframe_from_view_id(luid, infer_schema=False)
 
 antagonists = (
     lf
@@ -39,20 +38,11 @@ else:
     new_ndcs.write_csv(new_fn)
     print(f'{new_fn} written')
 
-    new_file = pl.concat([excluded_ndcs.collect(), new_ndcs])
-
-    range_name = 'excluded!A:B'
-    service = build('sheets', 'v4', credentials=creds)
-    service.spreadsheets().values().clear(spreadsheetId=sheet_id, range=range_name).execute()
-    data = [list(row) for row in new_file.rows()]
-    data.insert(0, ['NDC', 'drug'])
-    body = {
-        'values': data
-    }
-    result = service.spreadsheets().values().update(
+    result = services.sheets().spreadsheets().values().append(
         spreadsheetId=sheet_id,
-        range=range_name,
+        range='excluded!A:B',
         valueInputOption='RAW',
-        body=body
+        insertDataOption='INSERT_ROWS',
+        body={'values': new_ndcs.rows()},
     ).execute()
-    print(f"{result.get('updatedCells')} cells updated.")
+    print(f"{result['updates'].get('updatedCells')} cells updated.")
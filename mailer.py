@@ -0,0 +1,139 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from az_pmp_utils import email
+from googleapiclient import errors
+
+import services
+from constants import GMAIL_SENDS_PER_SECOND, PHX_TZ
+from ratelimit import RateLimiter
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}  # the only 403s worth retrying, the rest are permanent, eg: insufficientPermissions or dailyLimitExceeded
+
+_gmail_limiter = RateLimiter(GMAIL_SENDS_PER_SECOND)
+
+
+def _read_checkpoint(checkpoint: Path) -> dict[str, datetime]:
+    """
+    args:
+        checkpoint: a checkpoint file written by `send_all()`
+
+    returns:
+        the sent time of each message key in the checkpoint
+    """
+    if not checkpoint.exists():
+        return {}
+    sent = {}
+    with checkpoint.open(encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                sent[entry['key']] = datetime.fromisoformat(entry['sent_dt'])
+    return sent
+
+
+def _retryable(error: errors.HttpError) -> bool:
+    """
+    args:
+        error: an error from the gmail api
+
+    returns:
+        True if the error is a rate limit or server error that may pass on its own
+    """
+    if error.resp.status != 403:  # noqa: PLR2004 | forbidden
+        return error.resp.status in RETRY_STATUSES
+    try:
+        reasons = {detail.get('reason') for detail in json.loads(error.content)['error']['errors']}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return False
+    return bool(reasons & RATE_LIMIT_REASONS)
+
+
+def _send(message: email.EmailMessage, *, draft: bool, retries: int) -> datetime:
+    """
+    sends one message on the calling thread's gmail service, retrying rate limits and server errors with exponential backoff
+
+    args:
+        message: the message to send
+        draft: whether to create a draft instead of sending
+        retries: the max number of retries
+
+    returns:
+        the time the message was sent
+
+    raises:
+        HttpError: an error that is not retryable, or the last error once `retries` is used up
+        ConnectionError: the last connection error once `retries` is used up
+        TimeoutError: the last timeout once `retries` is used up
+    """
+    attempt = 0
+    while True:
+        _gmail_limiter.acquire()
+        try:
+            email.send_email(message, service=services.gmail(), draft=draft)
+            return datetime.now(tz=PHX_TZ)
+        except errors.HttpError as error:
+            if not _retryable(error) or attempt == retries:
+                raise
+        except (ConnectionError, TimeoutError):
+            if attempt == retries:
+                raise
+        time.sleep(2 ** attempt + random.random())  # noqa: S311 | jitter is not used for security
+        attempt += 1
+
+
+def send_all(messages: dict[str, email.EmailMessage], *, draft: bool = False, checkpoint: Path | None = None, workers: int = 4, retries: int = 5) -> dict[str, datetime | None]:
+    """
+    sends rendered messages concurrently, paced under the gmail quota by `GMAIL_SENDS_PER_SECOND`
+    when sending, every sent message is added to the checkpoint as soon as it is sent, and messages already in the checkpoint are not sent again,
+    so a run that stops partway through can be restarted without resending
+
+    args:
+        messages: the messages to send, keyed by something that identifies the recipient for this run, eg: a permit number
+        draft: whether to create drafts instead of sending; drafts are not checkpointed
+        checkpoint: a jsonl file of sent message keys, or None to not checkpoint
+        workers: the max number of messages to send at once
+        retries: the max number of retries for each message
+
+    returns:
+        the time each message sent in this run was sent, or None if it failed; messages skipped because they are already in the checkpoint are left out
+    """
+    if draft:
+        checkpoint = None
+    sent: dict[str, datetime | None] = {}
+    if checkpoint:
+        previously_sent = _read_checkpoint(checkpoint)
+        sent.update({key: sent_dt for key, sent_dt in previously_sent.items() if key in messages})
+        if sent:
+            print(f'{len(sent)} messages already sent according to {checkpoint}, skipping them')
+        checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    lock = threading.Lock()
+
+    def send(key: str) -> None:
+        try:
+            sent_dt = _send(messages[key], draft=draft, retries=retries)
+        except (errors.HttpError, ConnectionError, TimeoutError) as error:
+            print(f'failed to send message for {key}:')
+            print(f'error: {error!s}')
+            sent_dt = None
+        with lock:
+            sent[key] = sent_dt
+            if checkpoint and sent_dt:
+                with checkpoint.open('a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'sent_dt': sent_dt.isoformat()}) + '\n')
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gmail') as executor:
+        skipped = set(sent)
+        for future in [executor.submit(send, key) for key in messages if key not in skipped]:
+            future.result()
+
+    return {key: sent[key] for key in messages if key not in skipped}
@@ -0,0 +1,481 @@
+import csv
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import date, timedelta
+from io import BytesIO
+from pathlib import Path
+from typing import TYPE_CHECKING, Self
+
+import polars as pl
+from az_pmp_utils import drive
+from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+
+import services
+from constants import CACHE_DIR, DOWNLOAD_CHUNK_SIZE
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+METADATA_DIR = CACHE_DIR / 'masked'
+DIFF_BUCKETS = 256
+DIFF_RESULTS = ('added', 'removed', 'changed')
+
+
+@dataclass
+class ExtractStats:
+    """
+    statistics for a pipe delimited extract, gathered in one pass by `scan_extract()`
+
+    attributes:
+        columns: the header of the extract
+        rows: the number of data rows
+        min_filled: the earliest `dispensation_filled_at`, as YYYY-MM-DD
+        max_filled: the latest `dispensation_filled_at`, as YYYY-MM-DD
+        null_counts: the number of empty values in each column
+        sample: a uniform random sample of rows
+    """
+
+    columns: list[str]
+    rows: int = 0
+    min_filled: str | None = None
+    max_filled: str | None = None
+    null_counts: dict[str, int] = field(default_factory=dict)
+    sample: list[list[str]] = field(default_factory=list)
+
+    @property
+    def schema_hash(self) -> str:
+        """a sha256 of the ordered column names, for comparing schemas"""
+        return hashlib.sha256('|'.join(self.columns).encode()).hexdigest()
+
+    def metadata(self, md5_checksum: str | None = None) -> dict:
+        """
+        args:
+            md5_checksum: the google drive md5Checksum of the extract the stats are for
+
+        returns:
+            the stats without the sample, for writing to a sidecar
+        """
+        metadata = asdict(self)
+        del metadata['sample']
+        metadata['schema_hash'] = self.schema_hash
+        metadata['md5Checksum'] = md5_checksum
+        return metadata
+
+    @classmethod
+    def from_metadata(cls, metadata: dict) -> Self:
+        """
+        args:
+            metadata: a sidecar from `ExtractStats.metadata()`
+
+        returns:
+            the stats from the sidecar, with no sample
+        """
+        return cls(
+            columns=metadata['columns'],
+            rows=metadata['rows'],
+            min_filled=metadata['min_filled'],
+            max_filled=metadata['max_filled'],
+            null_counts=metadata['null_counts'],
+        )
+
+    @classmethod
+    def from_frame(cls, df: pl.DataFrame, sample_size: int = 20) -> Self:
+        """
+        gathers the stats from an extract that is already in memory, with nulls counted as empty values
+
+        args:
+            df: the extract, read with `infer_schema=False`
+            sample_size: the number of rows to sample
+
+        returns:
+            the statistics for the extract
+        """
+        filled = df.select(pl.col('dispensation_filled_at').str.slice(0, 10).min().alias('min'), pl.col('dispensation_filled_at').str.slice(0, 10).max().alias('max')) if 'dispensation_filled_at' in df.columns else None
+        return cls(
+            columns=df.columns,
+            rows=df.height,
+            min_filled=filled['min'].item() if filled is not None else None,
+            max_filled=filled['max'].item() if filled is not None else None,
+            null_counts=df.null_count().row(0, named=True),
+            sample=[list(row) for row in df.sample(min(sample_size, df.height)).iter_rows()],
+        )
+
+    def sample_frame(self) -> pl.DataFrame:
+        """
+        returns:
+            the sample as a dataframe of strings
+        """
+        return pl.DataFrame(self.sample, schema=dict.fromkeys(self.columns, pl.String), orient='row')
+
+
+def find_file(service, file_name: str, folder_id: str, *, required: bool = True) -> dict | None:  # noqa: ANN001 | service is dynamically typed
+    """
+    finds a file by name in a google drive folder
+
+    args:
+        service: an authorized google drive service
+        file_name: the name of the file
+        folder_id: the id of the folder on the google drive
+        required: whether to exit if the file is not found
+
+    returns:
+        the most recently modified matching file, with its id, name, size, modifiedTime and md5Checksum, or None if it was not found and not required
+    """
+    results = service.files().list(q=f"name = '{file_name}' and '{folder_id}' in parents and trashed = false",
+                                   supportsAllDrives=True,
+                                   includeItemsFromAllDrives=True,
+                                   orderBy='modifiedTime desc',
+                                   fields='files(id, name, size, modifiedTime, md5Checksum)').execute()
+    files = results.get('files', [])
+    if not files:
+        if required:
+            sys.exit(f'{file_name} not found on the google drive')
+        return None
+    return files[0]
+
+
+def stream_lines(service, file_id: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Iterator[str]:  # noqa: ANN001 | service is dynamically typed
+    """
+    streams a text file from the google drive one line at a time, holding at most one chunk in memory
+
+    args:
+        service: an authorized google drive service
+        file_id: the id of the file on the google drive
+        chunk_size: the number of bytes to download per request
+
+    yields:
+        each line of the file, including its line ending
+    """
+    buffer = BytesIO()
+    downloader = MediaIoBaseDownload(buffer, service.files().get_media(fileId=file_id, supportsAllDrives=True), chunksize=chunk_size)
+    remainder = b''
+    done = False
+    while not done:
+        _, done = downloader.next_chunk(num_retries=3)
+        *lines, remainder = (remainder + buffer.getvalue()).split(b'\n')
+        buffer.seek(0)
+        buffer.truncate()
+        for line in lines:
+            yield line.decode() + '\n'
+    if remainder:
+        yield remainder.decode()
+
+
+def _header(reader: Iterator[list[str]]) -> list[str]:
+    """
+    reads the header row of an extract, exiting if the extract is empty
+
+    args:
+        reader: a csv reader over the extract
+
+    returns:
+        the column names
+    """
+    columns = next(reader, None)
+    if columns is None:
+        sys.exit('the extract is empty, it does not have a header row')
+    return columns
+
+
+def scan_extract(lines: Iterator[str], sample_size: int = 20) -> ExtractStats:
+    """
+    gathers `ExtractStats` for a pipe delimited extract in one pass, with memory bounded by the sample size rather than the file size
+    the sample is a reservoir sample, so every row is equally likely to be in it
+
+    args:
+        lines: the lines of the extract, eg: from `stream_lines()`
+        sample_size: the number of rows to sample
+
+    returns:
+        the statistics for the extract
+    """
+    reader = csv.reader(lines, delimiter='|')
+    stats = ExtractStats(columns=_header(reader))
+    null_counts = [0] * len(stats.columns)
+    filled_index = stats.columns.index('dispensation_filled_at') if 'dispensation_filled_at' in stats.columns else None
+    min_filled = max_filled = None
+    for row in reader:
+        stats.rows += 1
+        if '' in row:
+            for i, value in enumerate(row[:len(null_counts)]):
+                if not value:
+                    null_counts[i] += 1
+        if filled_index is not None and filled_index < len(row) and (filled := row[filled_index][:10]):
+            if min_filled is None or filled < min_filled:
+                min_filled = filled
+            if max_filled is None or filled > max_filled:
+                max_filled = filled
+        if len(stats.sample) < sample_size:
+            stats.sample.append(row)
+        elif (i := random.randrange(stats.rows)) < sample_size:  # noqa: S311 | not used for security
+            stats.sample[i] = row
+    stats.min_filled = min_filled
+    stats.max_filled = max_filled
+    stats.null_counts = dict(zip(stats.columns, null_counts, strict=True))
+    return stats
+
+
+def sidecar_name(file_name: str) -> str:
+    """
+    args:
+        file_name: the name of an extract, eg: AZ_201901_masked.csv
+
+    returns:
+        the name of the extract's metadata sidecar, eg: AZ_201901_masked.meta.json
+    """
+    return f'{Path(file_name).stem}.meta.json'
+
+
+def read_metadata(service, file_name: str, folder_id: str, md5_checksum: str | None = None) -> dict | None:  # noqa: ANN001 | service is dynamically typed
+    """
+    reads an extract's metadata sidecar from the local cache, or from the google drive if it is not cached or the cached copy is for a different version of the extract
+
+    args:
+        service: an authorized google drive service
+        file_name: the name of the extract
+        folder_id: the id of the extract's folder on the google drive
+        md5_checksum: the google drive md5Checksum of the current extract, if known
+
+    returns:
+        the metadata from `ExtractStats.metadata()`, or None if there is no sidecar
+    """
+    local_path = METADATA_DIR / sidecar_name(file_name)
+    if local_path.exists():
+        metadata = json.loads(local_path.read_text(encoding='utf-8'))
+        if md5_checksum is None or metadata['md5Checksum'] == md5_checksum:
+            return metadata
+    sidecar = find_file(service, sidecar_name(file_name), folder_id, required=False)
+    if sidecar is None:
+        return None
+    content = service.files().get_media(fileId=sidecar['id'], supportsAllDrives=True).execute()
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    local_path.write_bytes(content)
+    return json.loads(content)
+
+
+def write_metadata(service, metadata: dict, file_name: str, folder_id: str) -> None:  # noqa: ANN001 | service is dynamically typed
+    """
+    writes an extract's metadata sidecar to the local cache and next to the extract on the google drive
+
+    args:
+        service: an authorized google drive service
+        metadata: the metadata from `ExtractStats.metadata()`
+        file_name: the name of the extract
+        folder_id: the id of the extract's folder on the google drive
+    """
+    content = json.dumps(metadata, indent=2).encode()
+    local_path = METADATA_DIR / sidecar_name(file_name)
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    local_path.write_bytes(content)
+
+    media = MediaIoBaseUpload(BytesIO(content), mimetype='application/json')
+    sidecar = find_file(service, sidecar_name(file_name), folder_id, required=False)
+    if sidecar:
+        service.files().update(fileId=sidecar['id'], media_body=media, supportsAllDrives=True).execute()
+    else:
+        file_metadata = {
+            'name': sidecar_name(file_name),
+            'parents': [folder_id],
+        }
+        service.files().create(supportsAllDrives=True, media_body=media, body=file_metadata).execute()
+
+
+def extract_stats(service, file_name: str, folder_id: str) -> ExtractStats:  # noqa: ANN001 | service is dynamically typed
+    """
+    gets an extract's stats from its metadata sidecar without downloading the extract
+    if the sidecar is missing or was written for a different version of the extract, the extract is streamed once and the sidecar is written
+
+    args:
+        service: an authorized google drive service
+        file_name: the name of the extract
+        folder_id: the id of the extract's folder on the google drive
+
+    returns:
+        the statistics for the extract, with no sample
+    """
+    extract = find_file(service, file_name, folder_id)
+    metadata = read_metadata(service, file_name, folder_id, extract['md5Checksum'])  # type: ignore[reportOptionalSubscript] | required files are not None
+    if metadata is None or metadata['md5Checksum'] != extract['md5Checksum']:  # type: ignore[reportOptionalSubscript] | required files are not None
+        print(f'no metadata for {file_name}, streaming...')
+        stats = scan_extract(stream_lines(service, extract['id']), sample_size=0)  # type: ignore[reportOptionalSubscript] | required files are not None
+        write_metadata(service, stats.metadata(extract['md5Checksum']), file_name, folder_id)  # type: ignore[reportOptionalSubscript] | required files are not None
+        return stats
+    return ExtractStats.from_metadata(metadata)
+
+
+def trend(service, masked_extract_folder: str, month_date: date, months: int) -> pl.DataFrame:  # noqa: ANN001 | service is dynamically typed
+    """
+    collects the metadata for a run of monthly masked extracts, writing sidecars for any that are missing
+
+    args:
+        service: an authorized google drive service
+        masked_extract_folder: the id of the masked extract folder on the google drive, with a subfolder for each year
+        month_date: a date in the month of the newest extract
+        months: the number of months to include
+
+    returns:
+        a row of stats for each extract, oldest first
+    """
+    rows = []
+    year_folders = {}
+    for _ in range(months):
+        if month_date.year not in year_folders:
+            year_folders[month_date.year] = drive.folder_id_from_name(folder_name=f'{month_date.year}', parent_folder_id=masked_extract_folder, service=service)
+        file_name = month_date.strftime('AZ_%Y%m_masked.csv')
+        stats = extract_stats(service, file_name, year_folders[month_date.year])
+        rows.append({
+            'file': file_name,
+            'rows': stats.rows,
+            'schema_hash': stats.schema_hash[:8],
+            'min_filled': stats.min_filled,
+            'max_filled': stats.max_filled,
+            'empty_values': sum(stats.null_counts.values()),
+        })
+        month_date = month_date.replace(day=1) - timedelta(days=1)
+    return (
+        pl.DataFrame(rows)
+        .reverse()
+        .with_columns(
+            ((pl.col('rows') - pl.col('rows').shift()) / pl.col('rows').shift() * 100).round(2).alias('percent_change')
+        )
+    )
+
+
+def _row_hash(values: list[str]) -> str:
+    """
+    args:
+        values: the values to hash
+
+    returns:
+        a 16 character hex hash of the values
+    """
+    return hashlib.blake2b('\x1f'.join(values).encode(), digest_size=8).hexdigest()
+
+
+def partition_extract(lines: Iterator[str], bucket_dir: Path, key: list[str] | None = None) -> list[str]:
+    """
+    splits an extract into `DIFF_BUCKETS` files on disk by the hash of each row's key, so matching rows from two extracts land in the same bucket
+    each bucket row is the key hash, the row hash, and then the original values
+
+    args:
+        lines: the lines of the extract, eg: from `stream_lines()`
+        bucket_dir: the folder to write the buckets to
+        key: the columns that identify a row, so rows with the same key and different values are reported as changed; the whole row if None
+
+    returns:
+        the header of the extract
+    """
+    reader = csv.reader(lines, delimiter='|')
+    columns = _header(reader)
+    key_indexes = [columns.index(col) for col in key] if key else None
+    bucket_dir.mkdir(parents=True, exist_ok=True)
+    bucket_files = [(bucket_dir / f'{i:02x}.csv').open('w', encoding='utf-8', newline='') for i in range(DIFF_BUCKETS)]
+    try:
+        writers = [csv.writer(f, delimiter='|') for f in bucket_files]
+        for row in reader:
+            row_hash = _row_hash(row)
+            key_hash = _row_hash([row[i] for i in key_indexes]) if key_indexes else row_hash
+            writers[int(key_hash[:2], 16)].writerow([key_hash, row_hash, *row])
+    finally:
+        for f in bucket_files:
+            f.close()
+    return columns
+
+
+def diff_bucket(old_bucket: Path, new_bucket: Path, out_dir: Path) -> dict[str, int]:
+    """
+    compares one bucket from each extract, writing the differing rows to `out_dir`
+
+    args:
+        old_bucket: a bucket of the older extract from `partition_extract()`
+        new_bucket: the matching bucket of the newer extract
+        out_dir: the folder to write `added`, `removed` and `changed` rows for this bucket to
+
+    returns:
+        the number of rows for each of `DIFF_RESULTS`
+    """
+    def read_bucket(bucket: Path) -> dict[str, dict[str, list[list[str]]]]:
+        rows = defaultdict(lambda: defaultdict(list))
+        with bucket.open(encoding='utf-8', newline='') as f:
+            for key_hash, row_hash, *row in csv.reader(f, delimiter='|'):
+                rows[key_hash][row_hash].append(row)
+        return rows
+
+    old_rows = read_bucket(old_bucket)
+    new_rows = read_bucket(new_bucket)
+    counts = dict.fromkeys(DIFF_RESULTS, 0)
+    out_files = {result: (out_dir / f'{result}_{old_bucket.stem}.csv').open('w', encoding='utf-8', newline='') for result in DIFF_RESULTS}
+    try:
+        writers = {result: csv.writer(f, delimiter='|') for result, f in out_files.items()}
+        for key_hash in old_rows.keys() | new_rows.keys():
+            old_counts = Counter({row_hash: len(rows) for row_hash, rows in old_rows.get(key_hash, {}).items()})
+            new_counts = Counter({row_hash: len(rows) for row_hash, rows in new_rows.get(key_hash, {}).items()})
+            removed = [row for row_hash, n in (old_counts - new_counts).items() for row in old_rows[key_hash][row_hash][:n]]
+            added = [row for row_hash, n in (new_counts - old_counts).items() for row in new_rows[key_hash][row_hash][:n]]
+            # rows that share a key but not values are paired up as changed, the rest are added or removed
+            changed = min(len(removed), len(added))
+            for old_row, new_row in zip(removed[:changed], added[:changed], strict=True):
+                writers['changed'].writerow(['old', *old_row])
+                writers['changed'].writerow(['new', *new_row])
+            writers['removed'].writerows(removed[changed:])
+            writers['added'].writerows(added[changed:])
+            counts['changed'] += changed
+            counts['removed'] += len(removed) - changed
+            counts['added'] += len(added) - changed
+    finally:
+        for f in out_files.values():
+            f.close()
+    return counts
+
+
+def diff_extracts(old_file_id: str, new_file_id: str, out_dir: Path, key: list[str] | None = None) -> dict[str, int]:
+    """
+    finds the rows added, removed and changed between two extracts in bounded memory
+    each extract is streamed into hash partitioned buckets on disk, one after the other to keep the number of open files under common limits,
+    and then the buckets are compared in parallel across processes
+    writes `added.csv`, `removed.csv` and `changed.csv` to `out_dir`, where `changed.csv` has an old and a new row for each change
+
+    args:
+        old_file_id: the id of the older extract on the google drive
+        new_file_id: the id of the newer extract on the google drive
+        out_dir: the folder to write the results to
+        key: the columns that identify a row, so rows with the same key and different values are reported as changed; the whole row if None
+
+    returns:
+        the number of rows for each of `DIFF_RESULTS`
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=CACHE_DIR) as temp_dir:
+        temp_path = Path(temp_dir)
+        service = services.drive()
+        print('partitioning old extract...')
+        old_columns = partition_extract(stream_lines(service, old_file_id), temp_path / 'old', key)
+        print('partitioning new extract...')
+        new_columns = partition_extract(stream_lines(service, new_file_id), temp_path / 'new', key)
+        if old_columns != new_columns:
+            sys.exit('the extracts have different columns, compare them with check_masked first')
+
+        print('comparing buckets...')
+        bucket_names = [f'{i:02x}.csv' for i in range(DIFF_BUCKETS)]
+        counts = dict.fromkeys(DIFF_RESULTS, 0)
+        with ProcessPoolExecutor(max_workers=os.process_cpu_count()) as executor:
+            for bucket_counts in executor.map(diff_bucket, [temp_path / 'old' / name for name in bucket_names], [temp_path / 'new' / name for name in bucket_names], [temp_path] * DIFF_BUCKETS):
+                for result, n in bucket_counts.items():
+                    counts[result] += n
+
+        for result in DIFF_RESULTS:
+            with (out_dir / f'{result}.csv').open('w', encoding='utf-8', newline='') as out_file:
+                csv.writer(out_file, delimiter='|').writerow(['version', *new_columns] if result == 'changed' else new_columns)
+                for name in bucket_names:
+                    with (temp_path / f'{result}_{Path(name).stem}.csv').open(encoding='utf-8', newline='') as bucket_file:
+                        shutil.copyfileobj(bucket_file, out_file)
+    return counts
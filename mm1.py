@@ -1,11 +1,13 @@
 import polars as pl
-from az_pmp_utils import drive
+from dotenv import load_dotenv
+
+import cache
 
 
 def mm1() -> None:
     """prepares the medical marijuana audit for `mm2.py` and prints instructions for transitioning between the two scripts"""
     awarxe = (
-        drive.awarxe()
+        cache.awarxe()
         .filter(
             pl.col('dea number').is_not_null()
         )
@@ -100,4 +102,5 @@ def mm1() -> None:
 
 
 if __name__ == '__main__':
+    load_dotenv()
     mm1()
@@ -3,8 +3,8 @@ from datetime import date, datetime
 from pathlib import Path
 
 import polars as pl
-from az_pmp_utils import tableau
 
+import cache
 from constants import PHX_TZ
 
 
@@ -19,13 +19,13 @@ def mm2() -> None:
         start, end = date(year=year, month=1, day=1), date(year=year, month=6, day=30)
 
     workbook_name = 'mm_audit'
-    user_ids_luid = tableau.find_view_luid('UserIDs', workbook_name)
+    user_ids_luid = cache.find_view_luid('UserIDs', workbook_name)
     print(f'luid found: {user_ids_luid}')
-    searches_luid = tableau.find_view_luid('Searches', workbook_name)
+    searches_luid = cache.find_view_luid('Searches', workbook_name)
     print(f'luid found: {searches_luid}')
 
     print('pulling user ids...')
-    user_ids_lf = tableau.lazyframe_from_view_id(user_ids_luid, infer_schema=False)
+    user_ids_lf = cache.lazyframe_from_view_id(user_ids_luid, infer_schema=False)
     users_explode = (
         user_ids_lf
         .drop_nulls('Associated DEA Number(s)')
@@ -44,7 +44,7 @@ def mm2() -> None:
         'search_end_date': end,
     }
     print('pulling searches data...')
-    searches_lf = tableau.lazyframe_from_view_id(searches_luid, filters=filters, infer_schema=False)
+    searches_lf = cache.lazyframe_from_view_id(searches_luid, filters=filters, infer_schema=False)
     searches_lf = (
         searches_lf
         .select(
@@ -2,19 +2,15 @@ import calendar
 import os
 import sys
 from datetime import date, datetime
-from typing import TYPE_CHECKING
 
 import polars as pl
-from az_pmp_utils import auth, deas, drive, num_and_dt
+from az_pmp_utils import num_and_dt
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 
+import cache
+import services
 from constants import PHX_TZ, TOP_PRESCRIBERS
 
-if TYPE_CHECKING:
-    import google.auth.external_account_authorized_user
-    import google.oauth2.credentials
-
 
 def input_str_to_date(month_name: str, year_str: str) -> date:
     """
@@ -33,17 +29,16 @@ def input_str_to_date(month_name: str, year_str: str) -> date:
     return date(int(year_str), month_num, 1)
 
 
-def update_appearances(creds: google.oauth2.credentials.Credentials | google.auth.external_account_authorized_user.Credentials, sheet_id: str, update_appearances: pl.LazyFrame) -> None:
+def update_appearances(sheet_id: str, update_appearances: pl.LazyFrame) -> None:
     """
     updates the appearances google sheet with the `new_appearances`
 
     args:
-        creds: google api credentials from auth()
         sheet_id: the id of the appearances sheet to update
         update_appearances: a lazyframe with the new data
     """
     range_name = 'appearances!A:B'
-    service = build('sheets', 'v4', credentials=creds)
+    service = services.sheets()
     service.spreadsheets().values().clear(spreadsheetId=sheet_id, range=range_name).execute()
     data = [list(row) for row in update_appearances.collect().rows()]
     data.insert(0, ['final_id', 'appearance_date'])
@@ -74,13 +69,10 @@ def process_mu(appearance_month: date, input_file: str) -> None:
 
     load_dotenv()
 
-    creds = auth.auth()
-    service = build('drive', 'v3', credentials=creds)
+    cache.prefetch_modified_times([os.environ['NO_VIOLATION_FILE'], os.environ['APPEARANCES_FILE']])
 
     no_violation = (
-        drive.lazyframe_from_id_and_sheetname(
-            service=service, file_id=os.environ['NO_VIOLATION_FILE'], sheet_name='no_violation', infer_schema_length=10000
-        )
+        cache.sheet(os.environ['NO_VIOLATION_FILE'], 'no_violation', infer_schema_length=10000)
         .with_columns(
             pl.col('exclude until').str.to_date(format='%m/%d/%Y'),
             pl.col('final_id').cast(pl.String)
@@ -105,7 +97,7 @@ def process_mu(appearance_month: date, input_file: str) -> None:
     )
 
     appear = (
-        drive.lazyframe_from_id_and_sheetname(service=service, file_id=os.environ['APPEARANCES_FILE'], sheet_name='appearances', engine='xlsx2csv', infer_schema_length=0)  # read_excel does not have infer schema
+        cache.sheet(os.environ['APPEARANCES_FILE'], 'appearances', engine='xlsx2csv', infer_schema_length=0)  # read_excel does not have infer schema
         .with_columns(
             pl.col('appearance_date').str.to_date('%Y-%-m-%-d')
         )
@@ -143,7 +135,7 @@ def process_mu(appearance_month: date, input_file: str) -> None:
     )
 
     dea = (
-        deas.deas('presc')
+        cache.deas('presc')
         .select('DEA Number', 'State License Number')
     )
 
@@ -167,7 +159,7 @@ def process_mu(appearance_month: date, input_file: str) -> None:
 
     print(f'{filepath} written')
 
-    update_appearances(creds, os.environ['APPEARANCES_FILE'], update_appearances=appear_combine)
+    update_appearances(os.environ['APPEARANCES_FILE'], update_appearances=appear_combine)
 
 
 if __name__ == '__main__':
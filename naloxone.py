@@ -8,9 +8,9 @@ import os
 
 import polars as pl
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
+from az_pmp_utils import email, tableau
 
-from az_pmp_utils import auth, email, tableau
+import services
 
 
 def naloxone_file():
@@ -57,9 +57,7 @@ def main():
     message_txt = f'Good {tod} DHS Team-\n\nWe are now up to {total_naloxone_str} doses of naloxone dispensed.{signature}'
     message = email.create_message_with_attachments(sender=sender, to=to, subject=subject, message_text=message_txt, file_paths=file_paths)
 
-    creds = auth.auth()
-    service = build('gmail', 'v1', credentials=creds)
-    email.send_email(service=service, message=message)
+    email.send_email(service=services.gmail(), message=message)
 
 
 if __name__ == '__main__':
@@ -1,14 +1,46 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 
 import polars as pl
 import polars_distance as pld
 from az_pmp_utils import tableau
 
+import cache
 
-def process_ods(input_file: str, days_before: int, ratio: float) -> None:
+
+def match_decedents(ods: pl.DataFrame, data: pl.DataFrame, days_before: int, ratio: float) -> pl.DataFrame:
+    """
+    matches pulled dispensations back to decedents by dob and name. each dob is pulled once for every decedent with it,
+    so a dispensation is only kept for the decedents whose own dod window it falls in
+
+    args:
+        ods: the decedents, with `DOB`, `DOD`, and `full_name` columns
+        data: the pulled dispensations, with `Day of Patient Birthdate`, `Day of Filled At`, and `orig_patient_name` columns
+        days_before: the number of days before `DOD` to check for dispensations
+        ratio: how similar names should be using a jaro-winkler ratio to consider a dispensation a match
+
+    returns:
+        the matched dispensations with a `ratio` column, sorted by `DOD` and `Day of Filled At`
+    """
+    return (
+        ods
+        .join(data, how='left', left_on='DOB', right_on='Day of Patient Birthdate')
+        .filter(
+            pl.col('Day of Filled At').is_between(pl.col('DOD') - pl.duration(days=days_before), pl.col('DOD') + pl.duration(days=1))
+        )
+        .with_columns(
+            (1 - pld.col('full_name').dist_str.jaro_winkler('orig_patient_name')).alias('ratio')
+        )
+        .filter(pl.col('ratio') >= ratio)
+        .sort('DOD', 'Day of Filled At')
+    )
+
+
+def process_ods(input_file: str, days_before: int, ratio: float, *, workers: int = 4, use_cache: bool = True) -> None:
     """
-    process overdose data by checking dispensation data for matching date of birth and fuzzy matched on name. writes a disp and an odt file to the `data/od/` folder. the input file should be in the following format:
+    process overdose data by checking dispensation data for matching date of birth and fuzzy matched on name. writes a disp and an odt file to the `data/od/` folder.
+    each dob is pulled from tableau once, concurrently, and the results are split back to each decedent's window locally. the input file should be in the following format:
 
     | column     | description                        | |------------|------------------------------------|
     | LAST NAME  |                                    |
@@ -20,6 +52,8 @@ def process_ods(input_file: str, days_before: int, ratio: float) -> None:
         input_file: file name in the `data/od/` folder without the .csv extension
         days_before: the number of days before `DOD` to check for dispensations
         ratio: how similar names should be using a jaro-winkler ratio to consider a dispensation a match
+        workers: the number of tableau requests to run at once
+        use_cache: whether to use cached tableau pulls
     """
     ods = (
         pl.read_csv(f'data/od/{input_file}.csv')
@@ -31,38 +65,62 @@ def process_ods(input_file: str, days_before: int, ratio: float) -> None:
     )
 
     print('pulling luids...')
-    od_luid = tableau.find_view_luid('od_disp', 'od')
+    od_luid = cache.find_view_luid('od_disp', 'od')
     print(f'found luid: {od_luid}')
-    odt_luid = tableau.find_view_luid('odt', 'od')
+    odt_luid = cache.find_view_luid('odt', 'od')
     print(f'found luid: {odt_luid}')
-    disp_data = pl.DataFrame()
-    odt_data = pl.DataFrame()
-    for row in ods.iter_rows(named=True):
-        start_date = row['DOD'] - timedelta(days=days_before)
-        end_date = row['DOD'] + timedelta(days=1)
-        dob = row['DOB']
+
+    def pull_dob(data_name: str, luid: str, dob_window: dict, **kwargs) -> pl.DataFrame | None:
+        """
+        pulls one view for a single dob with a date window covering every decedent with that dob
+
+        args:
+            data_name: the name of the data for printing
+            luid: the luid of the view
+            dob_window: a row of `dob_windows`
+            **kwargs: passed to `cache.lazyframe_from_view_id()`
+
+        returns:
+            the pulled data, or None if there was none
+        """
+        start_date = dob_window['first_dod'] - timedelta(days=days_before)
+        end_date = dob_window['last_dod'] + timedelta(days=1)
+        dob = dob_window['DOB']
         filters = {
             'start_date': start_date,
             'end_date': end_date,
             'search_dob': dob
         }
-        print(f'pulling disp data for {dob}...')
-        try:
-            disp_df = tableau.lazyframe_from_view_id(od_luid, filters=filters, infer_schema=False)
-        except tableau.TableauNoDataError:
-            print(f'no disp data found for {start_date} - {end_date} with dob: {dob}')
-        else:
-            disp_data = pl.concat([disp_data, disp_df.collect()])
-            print('disp data pulled')
-
-        print(f'pulling odt data for {dob}...')
+        print(f'pulling {data_name} data for {dob}...')
         try:
-            odt_df = tableau.lazyframe_from_view_id(odt_luid, filters=filters)
+            df = cache.lazyframe_from_view_id(luid, filters=filters, use_cache=use_cache, **kwargs).collect()
         except tableau.TableauNoDataError:
-            print(f'no odt data found for dob: {dob}')
-        else:
-            odt_data = pl.concat([odt_data, odt_df.collect()])
-            print('odt data pulled')
+            print(f'no {data_name} data found for {start_date} - {end_date} with dob: {dob}')
+            return None
+        print(f'{data_name} data pulled for {dob}')
+        return df
+
+    # each dob is pulled once, with a window from days_before its earliest dod to the day after its latest dod
+    dob_windows = (
+        ods
+        .group_by('DOB')
+        .agg(
+            pl.col('DOD').min().alias('first_dod'),
+            pl.col('DOD').max().alias('last_dod'),
+        )
+        .sort('first_dod')
+    )
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        disp_futures = []
+        odt_futures = []
+        for dob_window in dob_windows.iter_rows(named=True):
+            disp_futures.append(executor.submit(pull_dob, 'disp', od_luid, dob_window, infer_schema=False))
+            odt_futures.append(executor.submit(pull_dob, 'odt', odt_luid, dob_window))
+        disp_frames = [df for future in disp_futures if (df := future.result()) is not None]
+        odt_frames = [df for future in odt_futures if (df := future.result()) is not None]
+
+    disp_data = pl.concat(disp_frames) if disp_frames else pl.DataFrame()
+    odt_data = pl.concat(odt_frames, how='vertical_relaxed') if odt_frames else pl.DataFrame()
 
     print(disp_data)
     print(odt_data)
@@ -77,13 +135,7 @@ def process_ods(input_file: str, days_before: int, ratio: float) -> None:
             .drop('Orig Patient First Name', 'Orig Patient Last Name')
         )
         ods_disp = (
-            ods
-            .join(disp_data, how='left', left_on='DOB', right_on='Day of Patient Birthdate')
-            .with_columns(
-                (1 - pld.col('full_name').dist_str.jaro_winkler('orig_patient_name')).alias('ratio')
-            )
-            .filter(pl.col('ratio') >= ratio)
-            .sort('DOD', 'Day of Filled At')
+            match_decedents(ods, disp_data, days_before, ratio)
             .select(
                 'DOB',
                 'full_name',
@@ -119,13 +171,7 @@ def process_ods(input_file: str, days_before: int, ratio: float) -> None:
             .drop('Orig Patient First Name', 'Orig Patient Last Name')
         )
         ods_odt = (
-            ods
-            .join(odt_data, how='left', left_on='DOB', right_on='Day of Patient Birthdate')
-            .with_columns(
-                (1 - pld.col('full_name').dist_str.jaro_winkler('orig_patient_name')).alias('ratio')
-            )
-            .filter(pl.col('ratio') >= ratio)
-            .sort('DOD', 'Day of Filled At')
+            match_decedents(ods, odt_data, days_before, ratio)
             .select(
                 'DOB',
                 'full_name',
@@ -148,7 +194,9 @@ if __name__ == '__main__':
     parser.add_argument('-f', '--file', type=str, default='od', help='file name to be inspected; no extension (default: %(default)s)')
     parser.add_argument('-d', '--days-before', type=int, default=90, help='max number of days before DOD to consider a dispensation a match (default: %(default)s)')
     parser.add_argument('-r', '--ratio', type=float, default=0.8, help='patient name similarity ratio for dispensation to be considered a match (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='number of tableau requests to run at once (default: %(default)s)')
+    parser.add_argument('-nc', '--no-cache', action='store_true', help='pull every view from tableau instead of using cached pulls')
 
     args = parser.parse_args()
 
-    process_ods(args.file, args.days_before, args.ratio)
+    process_ods(args.file, args.days_before, args.ratio, workers=args.workers, use_cache=not args.no_cache)
@@ -3,9 +3,9 @@ from datetime import datetime, timedelta
 from pathlib import Path
 
 import polars as pl
-from az_pmp_utils import drive
 from dotenv import load_dotenv
 
+import cache
 from constants import PHX_TZ
 
 load_dotenv()
@@ -15,8 +15,11 @@ last_mo = today.replace(day=1) - timedelta(days=1)
 last_last_mo = (last_mo.replace(day=1) - timedelta(days=1)).replace(day=1)
 
 inspection_tracker_file_id = os.environ['PERMIT_INSPECTION_TRACKER_FILE']
+license_tracker_file_id = os.environ['PI_LICENSE_TRACKER_FILE']
+cache.prefetch_modified_times([inspection_tracker_file_id, license_tracker_file_id])
+
 inspections = (
-    drive.lazyframe_from_id_and_sheetname(file_id=inspection_tracker_file_id, sheet_name='input', infer_schema_length=0, read_options={'header_row': 4})  # read_excel() does not have infer_schema
+    cache.sheet(inspection_tracker_file_id, 'input', infer_schema_length=0, read_options={'header_row': 4})  # read_excel() does not have infer_schema
     .select(
         pl.col('Current Routine Inspection Date').str.to_date('%Y-%m-%d %H:%M:%S').alias('inspection_date'),
         pl.col('Permit #').str.strip_chars().str.to_uppercase().alias('permit_number'),
@@ -33,9 +36,8 @@ inspections = (
     )
 )
 
-license_tracker_file_id = os.environ['PI_LICENSE_TRACKER_FILE']
 licenses = (
-    drive.lazyframe_from_id_and_sheetname(file_id=license_tracker_file_id, sheet_name='Form Responses 1', infer_schema_length=0)  # read_excel() does not have infer_schema
+    cache.sheet(license_tracker_file_id, 'Form Responses 1', infer_schema_length=0)  # read_excel() does not have infer_schema
     .select(
         pl.col('Timestamp').str.to_date('%Y-%m-%d %H:%M:%S%.f').alias('submit_date'),
         pl.col('Permit Number').str.strip_chars().str.to_uppercase().alias('permit_number'),
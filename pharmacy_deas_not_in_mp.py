@@ -1,22 +1,19 @@
 from pathlib import Path
 
 import polars as pl
-from az_pmp_utils import deas, files
+
+import cache
 
 # ruff: noqa: PLC1901
 # polars cols with empty string are not falsey
 
-mp_fp = Path('data/pharmacies.csv')
-files.warn_file_age(mp_fp)
 mp = (
-    pl.scan_csv(mp_fp, infer_schema=False)
+    cache.manage_pharmacies()
     .select('DEA')
 ).collect()['DEA'].to_list()
 
-ig_fp = Path('data/List Request.csv')
-files.warn_file_age(ig_fp)
 igov = (
-    pl.scan_csv(ig_fp, infer_schema=False)
+    cache.list_request()
     .filter(
         pl.col('Type') == 'Pharmacy'
     )
@@ -24,7 +21,7 @@ igov = (
 )
 
 dea = (
-    deas.deas('pharm')
+    cache.deas('pharm')
     .filter(pl.col('DEA Number').is_in(mp).not_())
     .join(igov, how='left', left_on='State License Number', right_on='License/Permit #')
     .with_columns(
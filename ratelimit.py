@@ -0,0 +1,37 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    a thread safe token bucket for pacing requests to a server
+
+    attributes:
+        rate: tokens added to the bucket per second
+        burst: max tokens in the bucket, the number of requests that can be made at once after being idle
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """
+        args:
+            rate: requests allowed per second
+            burst: requests allowed at once after being idle
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """blocks until a request can be made"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
@@ -1,18 +1,13 @@
 import datetime
 import os
-from typing import TYPE_CHECKING
 
 import polars as pl
-from az_pmp_utils import auth, drive
+from az_pmp_utils import drive
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 
+import services
 from constants import PHX_TZ
 
-if TYPE_CHECKING:
-    import google.auth.external_account_authorized_user
-    import google.oauth2.credentials
-
 
 def pull_files(service) -> pl.DataFrame:  # noqa: ANN001 | service is dynamically typed
     """
@@ -70,16 +65,15 @@ def pull_files(service) -> pl.DataFrame:  # noqa: ANN001 | service is dynamicall
     return pl.concat([date_col, df_lookups, ob_df_lookups], how='horizontal')
 
 
-def update_scorecard_sheet(creds: google.oauth2.credentials.Credentials | google.auth.external_account_authorized_user.Credentials, new_row: pl.DataFrame) -> None:
+def update_scorecard_sheet(new_row: pl.DataFrame) -> None:
     """
     update the scorecard sheet with the new row
 
     args:
-        creds: google credentials returned by `auth.auth()`
         new_row: the new row returned by `pull_files()`
     """
     sheet_id = os.environ['SCORECARD_FILE']
-    service = build('sheets', 'v4', credentials=creds)
+    service = services.sheets()
     result = service.spreadsheets().values().get(spreadsheetId=sheet_id, range='scorecard!A:A').execute()
     values = result.get('values', [])
 
@@ -102,8 +96,7 @@ def update_scorecard_sheet(creds: google.oauth2.credentials.Credentials | google
 if __name__ == '__main__':
     load_dotenv()
 
-    creds = auth.auth()
-    service = build('drive', 'v3', credentials=creds)
+    service = services.drive()
 
     new_row = pull_files(service)
-    update_scorecard_sheet(creds, new_row)
+    update_scorecard_sheet(new_row)
@@ -0,0 +1,162 @@
+import functools
+import json
+import threading
+from typing import TYPE_CHECKING
+
+import google_auth_httplib2
+import httplib2
+from az_pmp_utils import auth
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+if TYPE_CHECKING:
+    from googleapiclient.http import HttpRequest
+
+API_VERSIONS = {
+    'docs': 'v1',
+    'drive': 'v3',
+    'gmail': 'v1',
+    'sheets': 'v4',
+}
+
+BATCH_LIMIT = 100  # max calls google allows in one batch http request
+
+_lock = threading.Lock()
+_discovery_docs: dict[str, dict | None] = {}
+_local = threading.local()
+
+
+@functools.cache
+def credentials():  # noqa: ANN201 | credentials are dynamically typed
+    """
+    authorizes once per process with `auth.auth()`
+
+    returns:
+        the shared google api credentials
+    """
+    return auth.auth()
+
+
+def _discovery_doc(api: str) -> dict | None:
+    """
+    parses the discovery document bundled with `googleapiclient` once per process
+
+    args:
+        api: the api name, eg: 'drive'
+
+    returns:
+        the parsed discovery document, or None if it is not bundled
+    """
+    with _lock:
+        if api not in _discovery_docs:
+            doc = get_static_doc(api, API_VERSIONS[api])
+            _discovery_docs[api] = json.loads(doc) if doc else None
+        return _discovery_docs[api]
+
+
+def service(api: str):  # noqa: ANN201 | services are dynamically typed
+    """
+    gets an authorized service from the pool
+    each thread gets its own services and keep-alive http connection, since `httplib2` is not thread safe,
+    but all threads share the same credentials and parsed discovery documents
+
+    args:
+        api: the api name, one of `API_VERSIONS`
+
+    returns:
+        an authorized google api service
+    """
+    services = getattr(_local, 'services', None)
+    if services is None:
+        services = _local.services = {}
+        _local.http = google_auth_httplib2.AuthorizedHttp(credentials(), http=httplib2.Http())
+
+    if api not in services:
+        doc = _discovery_doc(api)
+        if doc is None:
+            services[api] = build(api, API_VERSIONS[api], http=_local.http)
+        else:
+            services[api] = build_from_document(doc, http=_local.http)
+    return services[api]
+
+
+def docs():  # noqa: ANN201 | services are dynamically typed
+    """
+    returns:
+        this thread's google docs service
+    """
+    return service('docs')
+
+
+def drive():  # noqa: ANN201 | services are dynamically typed
+    """
+    returns:
+        this thread's google drive service
+    """
+    return service('drive')
+
+
+def gmail():  # noqa: ANN201 | services are dynamically typed
+    """
+    returns:
+        this thread's gmail service
+    """
+    return service('gmail')
+
+
+def sheets():  # noqa: ANN201 | services are dynamically typed
+    """
+    returns:
+        this thread's google sheets service
+    """
+    return service('sheets')
+
+
+def execute_batch_results(service, requests: dict[str, HttpRequest]) -> tuple[dict[str, dict], dict[str, Exception]]:  # noqa: ANN001 | services are dynamically typed
+    """
+    executes requests with batch http requests of up to `BATCH_LIMIT` calls each, instead of one http request per call
+    every request is sent even if some fail, so callers can clean up after the ones that failed
+
+    args:
+        service: the service the requests were built with
+        requests: the requests to execute, keyed by an id for their responses
+
+    returns:
+        the response for each request that succeeded and the exception for each request that failed, both keyed by the same ids
+    """
+    responses = {}
+    errors = {}
+
+    def callback(request_id: str, response: dict, exception: Exception | None) -> None:
+        if exception is not None:
+            errors[request_id] = exception
+        else:
+            responses[request_id] = response
+
+    items = list(requests.items())
+    for i in range(0, len(items), BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=callback)
+        for request_id, request in items[i:i + BATCH_LIMIT]:
+            batch.add(request, request_id=request_id)
+        batch.execute()
+    return responses, errors
+
+
+def execute_batch(service, requests: dict[str, HttpRequest]) -> dict[str, dict]:  # noqa: ANN001 | services are dynamically typed
+    """
+    executes requests with `execute_batch_results()`
+    if any failed, the first exception the batch callback stored for them is re-raised after every request is sent,
+    usually an `HttpError`
+
+    args:
+        service: the service the requests were built with
+        requests: the requests to execute, keyed by an id for their responses
+
+    returns:
+        the response for each request, keyed by the same ids
+    """
+    responses, errors = execute_batch_results(service, requests)
+    if errors:
+        first_error = next(iter(errors.values()))
+        raise first_error
+    return responses
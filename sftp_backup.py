@@ -1,156 +1,687 @@
 import argparse
+import hashlib
+import json
 import os
+import queue
+import sqlite3
 import stat
 import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Self
 from zoneinfo import ZoneInfo
 
 import paramiko
-from az_pmp_utils import auth
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseUpload
 
+import services
+from constants import CACHE_DIR
 
-def del_prev(delete_prev_line: bool) -> None:  # noqa: FBT001 | only one arg
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+DRIVE_FILE_FIELDS = 'id, name, mimeType, modifiedTime, size, md5Checksum'
+CHUNK_SIZE = 1024 * 1024
+SESSION_TTL = timedelta(days=7)  # google drive expires resumable upload sessions after a week
+
+
+class Progress:
+    """
+    thread safe counts of transfer results, printed as a single status line that is rewritten in place
+
+    attributes:
+        counts: the number of files with each result
+    """
+
+    def __init__(self) -> None:
+        """starts every count at 0"""
+        self.counts = dict.fromkeys(('uploaded', 'updated', 'unchanged', 'too old', 'failed'), 0)
+        self._lock = threading.Lock()
+
+    def __str__(self) -> str:
+        """
+        returns:
+            the status line
+        """
+        checked = sum(self.counts.values())
+        return f'{checked} files checked: ' + ', '.join(f'{count} {result}' for result, count in self.counts.items())
+
+    def log(self, message: str) -> None:
+        """
+        prints a message above the status line
+
+        args:
+            message: the message to print
+        """
+        with self._lock:
+            print(f'\r\x1b[2K{message}')
+            print(self, end='', flush=True)
+
+    def update(self, result: str, message: str | None = None) -> None:
+        """
+        counts a file result and refreshes the status line
+
+        args:
+            result: one of the keys of `counts`
+            message: an optional message to print above the status line
+        """
+        with self._lock:
+            self.counts[result] += 1
+            if message:
+                print(f'\r\x1b[2K{message}')
+            print(f'\r\x1b[2K{self}', end='', flush=True)
+
+
+class Manifest:
+    """
+    a local sqlite record of what has been backed up, so unchanged files can be skipped without checking the google drive
+    safe to share between threads
+
+    tables:
+        files: remote_path, size, mtime, drive_file_id, uploaded_at
+        folders: remote_path, drive_folder_id
+        sessions: remote_path, size, mtime, resumable_uri, started_at
+    """
+
+    def __init__(self, path: Path) -> None:
+        """
+        args:
+            path: the path to the sqlite database, created if it does not exist
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                create table if not exists files (
+                    remote_path text primary key,
+                    size integer,
+                    mtime integer,
+                    drive_file_id text not null,
+                    uploaded_at text not null
+                )
+            """)
+            self._conn.execute("""
+                create table if not exists folders (
+                    remote_path text primary key,
+                    drive_folder_id text not null
+                )
+            """)
+            self._conn.execute("""
+                create table if not exists sessions (
+                    remote_path text primary key,
+                    size integer,
+                    mtime integer,
+                    resumable_uri text not null,
+                    started_at text not null
+                )
+            """)
+
+    def __enter__(self) -> Self:
+        """
+        returns:
+            the manifest
+        """
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """closes the database with `close()`"""
+        self.close()
+
+    def unchanged(self, remote_file_path: str, attrs: paramiko.SFTPAttributes) -> bool:
+        """
+        checks whether a file matches the size and mtime it had when it was last backed up
+
+        args:
+            remote_file_path: the remote file path
+            attrs: the file's current attributes from the sftp
+
+        returns:
+            True if the file was backed up and has not changed since
+        """
+        with self._lock:
+            row = self._conn.execute('select size, mtime from files where remote_path = ?', (remote_file_path,)).fetchone()
+        return row is not None and row == (attrs.st_size, attrs.st_mtime)
+
+    def record(self, remote_file_path: str, attrs: paramiko.SFTPAttributes, drive_file_id: str) -> None:
+        """
+        records a file as backed up
+
+        args:
+            remote_file_path: the remote file path
+            attrs: the file's attributes from the sftp when it was checked
+            drive_file_id: the id of the backup on the google drive
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'insert or replace into files values (?, ?, ?, ?, ?)',
+                (remote_file_path, attrs.st_size, attrs.st_mtime, drive_file_id, datetime.now(tz=ZoneInfo('UTC')).isoformat()),
+            )
+
+    def folder(self, remote_path: str) -> str | None:
+        """
+        args:
+            remote_path: the remote directory path
+
+        returns:
+            the id of the directory's backup folder on the google drive, if known
+        """
+        with self._lock:
+            row = self._conn.execute('select drive_folder_id from folders where remote_path = ?', (remote_path,)).fetchone()
+        return row[0] if row else None
+
+    def record_folder(self, remote_path: str, drive_folder_id: str) -> None:
+        """
+        records the backup folder for a directory
+
+        args:
+            remote_path: the remote directory path
+            drive_folder_id: the id of the directory's backup folder on the google drive
+        """
+        with self._lock, self._conn:
+            self._conn.execute('insert or replace into folders values (?, ?)', (remote_path, drive_folder_id))
+
+    def session(self, remote_file_path: str, attrs: paramiko.SFTPAttributes) -> str | None:
+        """
+        finds an unfinished upload of a file that can be resumed
+
+        args:
+            remote_file_path: the remote file path
+            attrs: the file's current attributes from the sftp
+
+        returns:
+            the resumable upload session uri, if the file has not changed and the session has not expired
+        """
+        with self._lock:
+            row = self._conn.execute('select size, mtime, resumable_uri, started_at from sessions where remote_path = ?', (remote_file_path,)).fetchone()
+        if row is None:
+            return None
+        size, mtime, resumable_uri, started_at = row
+        if (size, mtime) != (attrs.st_size, attrs.st_mtime) or datetime.now(tz=ZoneInfo('UTC')) - datetime.fromisoformat(started_at) > SESSION_TTL:
+            return None
+        return resumable_uri
+
+    def record_session(self, remote_file_path: str, attrs: paramiko.SFTPAttributes, resumable_uri: str) -> None:
+        """
+        records a started upload so it can be resumed if it is interrupted
+
+        args:
+            remote_file_path: the remote file path
+            attrs: the file's attributes from the sftp when the upload started
+            resumable_uri: the resumable upload session uri
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'insert or replace into sessions values (?, ?, ?, ?, ?)',
+                (remote_file_path, attrs.st_size, attrs.st_mtime, resumable_uri, datetime.now(tz=ZoneInfo('UTC')).isoformat()),
+            )
+
+    def clear_session(self, remote_file_path: str) -> None:
+        """
+        forgets an upload session once it is finished or can no longer be resumed
+
+        args:
+            remote_file_path: the remote file path
+        """
+        with self._lock, self._conn:
+            self._conn.execute('delete from sessions where remote_path = ?', (remote_file_path,))
+
+    def close(self) -> None:
+        """closes the database"""
+        with self._lock:
+            self._conn.close()
+
+
+class DriveFolder:
+    """
+    a google drive folder whose files are listed once, on first use
+    safe to share between threads
+
+    attributes:
+        id: the id of the folder on the google drive
+    """
+
+    def __init__(self, folder_id: str, drive_files: dict[str, dict] | None = None) -> None:
+        """
+        args:
+            folder_id: the id of the folder on the google drive
+            drive_files: the folder's files, if already known
+        """
+        self.id = folder_id
+        self._files = drive_files
+        self._lock = threading.Lock()
+
+    def files(self, service) -> dict[str, dict]:  # noqa: ANN001 | service is dynamically typed
+        """
+        args:
+            service: an authorized google drive service, used to list the folder the first time
+
+        returns:
+            the folder's files from `list_folder()`
+        """
+        with self._lock:
+            if self._files is None:
+                self._files = list_folder(service, self.id)
+            return self._files
+
+
+class Channels:
+    """
+    opens one sftp channel per thread on a shared ssh transport
+    safe to share between threads
+    """
+
+    def __init__(self, transport: paramiko.Transport) -> None:
+        """
+        args:
+            transport: the connected paramiko Transport
+        """
+        self.transport = transport
+        self._local = threading.local()
+        self._channels: list[paramiko.SFTPClient] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> paramiko.SFTPClient:
+        """
+        returns:
+            this thread's sftp channel, opened on first use
+        """
+        sftp = getattr(self._local, 'sftp', None)
+        if sftp is None:
+            sftp = self._local.sftp = paramiko.SFTPClient.from_transport(self.transport)
+            if sftp is None:
+                sys.exit('could not open an sftp channel')
+            with self._lock:
+                self._channels.append(sftp)
+        return sftp
+
+    def close(self) -> None:
+        """closes every channel that was opened"""
+        with self._lock:
+            for sftp in self._channels:
+                sftp.close()
+            self._channels.clear()
+
+
+class TransferScheduler:
+    """
+    runs file transfers on a pool of worker threads
+    each worker opens its own sftp channel on the shared ssh transport and uses its own drive service from `services`
+
+    attributes:
+        transport: the connected paramiko Transport
+        manifest: the record of backed up files, updated as files are checked
+        progress: the aggregated progress of the transfers
     """
-    delete the previous printed line
 
+    def __init__(self, transport: paramiko.Transport, workers: int, manifest: Manifest) -> None:
+        """
+        args:
+            transport: the connected paramiko Transport
+            workers: the max number of transfers to run at once
+            manifest: the record of backed up files, updated as files are checked
+        """
+        self.transport = transport
+        self.manifest = manifest
+        self.progress = Progress()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transfer')
+        self._futures: list[Future] = []
+        self._channels = Channels(transport)
+
+    def __enter__(self) -> Self:
+        """
+        returns:
+            the scheduler
+        """
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """waits for the queued transfers with `close()`"""
+        self.close()
+
+    def submit(self, remote_file_path: str, attrs: paramiko.SFTPAttributes, folder: DriveFolder) -> None:
+        """
+        queues a file for transfer
+
+        args:
+            remote_file_path: the remote file path to the file for potential uploading
+            attrs: the file's attributes from the sftp
+            folder: the target folder on the google drive
+        """
+        self._futures.append(self._executor.submit(self._transfer, remote_file_path, attrs, folder))
+
+    def _transfer(self, remote_file_path: str, attrs: paramiko.SFTPAttributes, folder: DriveFolder) -> None:
+        """
+        transfers a file on a worker thread and records the result
+
+        args:
+            remote_file_path: the remote file path to the file for potential uploading
+            attrs: the file's attributes from the sftp
+            folder: the target folder on the google drive
+        """
+        try:
+            result, message = upload_file(self._channels.get(), remote_file_path, attrs, folder, self.manifest)
+            self.manifest.record(remote_file_path, attrs, folder.files(services.drive())[os.path.basename(remote_file_path)]['id'])  # noqa: PTH119 | paramiko is not compatible with Path
+        except (HttpError, OSError, paramiko.SSHException) as error:
+            result, message = 'failed', f'error backing up {remote_file_path}: {error}'
+        self.progress.update(result, message)
+
+    def close(self) -> None:
+        """waits for all queued transfers to finish and closes the worker channels"""
+        self._executor.shutdown(wait=True)
+        self._channels.close()
+        for future in self._futures:
+            future.result()
+
+
+def remote_mtime(attrs: paramiko.SFTPAttributes) -> datetime:
+    """
     args:
-        delete_prev_line: whether to perform the delete
+        attrs: a file's attributes from the sftp
+
+    returns:
+        the file's mtime, or 2001-01-01 if the sftp did not report one
+    """
+    st_mtime = attrs.st_mtime
+    return datetime.fromtimestamp(float(st_mtime)).astimezone(tz=ZoneInfo('UTC')) if isinstance(st_mtime, int) else datetime(year=2001, month=1, day=1, tzinfo=ZoneInfo('UTC'))
+
+
+def remote_md5(sftp: paramiko.SFTPClient, remote_file_path: str) -> str:
+    """
+    computes the md5 of a file on the sftp, streaming it in chunks
+
+    args:
+        sftp: a connected paramiko SFTPClient
+        remote_file_path: the remote file path
+
+    returns:
+        the hex md5 digest, comparable to the google drive `md5Checksum`
+    """
+    md5 = hashlib.md5(usedforsecurity=False)
+    with sftp.file(remote_file_path, 'rb') as remote_file_content:
+        remote_file_content.prefetch()
+        while chunk := remote_file_content.read(CHUNK_SIZE):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def session_status(request, resumable_uri: str) -> tuple[int | None, dict | None]:  # noqa: ANN001 | request is dynamically typed
+    """
+    asks google drive how much of an interrupted resumable upload it already has
+
+    args:
+        request: the files().create or files().update request being resumed
+        resumable_uri: the resumable upload session uri
+
+    returns:
+        the number of bytes the server has, or None if the session has expired, and the uploaded file's metadata if the upload had already finished
+
+    raises:
+        HttpError: the server answered with an error other than the session being expired
     """
-    line_up = '\033[1A'
-    line_clear = '\x1b[2K'
-    if delete_prev_line:
-        print(line_up, end=line_clear)
+    resp, content = request.http.request(
+        resumable_uri,
+        method='PUT',
+        headers={'Content-Length': '0', 'Content-Range': f'bytes */{request.resumable.size()}'},
+    )
+    if resp.status in {200, 201}:
+        return request.resumable.size(), json.loads(content)
+    if resp.status == 308:  # noqa: PLR2004 | resume incomplete
+        # the range header is the bytes the server has, eg: 'bytes=0-1048575', and is missing if it has none
+        return (int(resp['range'].rpartition('-')[2]) + 1 if 'range' in resp else 0), None
+    if resp.status in {404, 410}:
+        return None, None
+    raise HttpError(resp, content, uri=resumable_uri)
 
 
-def upload_file(service, sftp: paramiko.SFTPClient, remote_file_path: str, drive_folder_id: str) -> None:  # noqa: ANN001 | service is dynamically typed
+def resumable_upload(request, manifest: Manifest, remote_file_path: str, attrs: paramiko.SFTPAttributes) -> dict:  # noqa: ANN001 | request is dynamically typed
     """
-    uploads a file to the google drive if it is new or has been modified
-    only checks files with an mtime younger than 24 hours
+    runs a resumable upload one chunk at a time, keeping the session uri in the manifest so an interrupted upload continues from where it stopped on the next run
+    a saved session is resumed by asking the server how much it has with `session_status()` and continuing the request from there
+
+    args:
+        request: a files().create or files().update request with a resumable media body
+        manifest: the record of backed up files and upload sessions
+        remote_file_path: the remote file path being uploaded
+        attrs: the file's attributes from the sftp
+
+    returns:
+        the uploaded file's metadata
+
+    raises:
+        HttpError: an upload error that `next_chunk()` could not retry
+    """
+    resumable_uri = manifest.session(remote_file_path, attrs)
+    if resumable_uri:
+        progress, response = session_status(request, resumable_uri)
+        if response is not None:
+            manifest.clear_session(remote_file_path)
+            return response
+        if progress is None:
+            manifest.clear_session(remote_file_path)
+            resumable_uri = None
+        else:
+            request.resumable_uri = resumable_uri
+            request.resumable_progress = progress
+    response = None
+    while response is None:
+        try:
+            _, response = request.next_chunk(num_retries=3)
+        except HttpError as error:
+            if resumable_uri is None or error.resp.status not in {404, 410}:
+                raise
+            # the session expired during the upload, start it over, next_chunk() opens a new session when there is no uri
+            manifest.clear_session(remote_file_path)
+            request.resumable_uri = resumable_uri = None
+            request.resumable_progress = 0
+            continue
+        if request.resumable_uri and request.resumable_uri != resumable_uri:
+            resumable_uri = request.resumable_uri
+            manifest.record_session(remote_file_path, attrs, resumable_uri)
+    manifest.clear_session(remote_file_path)
+    return response
+
+
+def upload_file(sftp: paramiko.SFTPClient, remote_file_path: str, attrs: paramiko.SFTPAttributes, folder: DriveFolder, manifest: Manifest) -> tuple[str, str | None]:
+    """
+    uploads a file to the google drive if it is new or has been modified, using this thread's drive service
+    a file with a newer mtime that is the same size as its backup is hashed and skipped if its md5 matches
 
     args:
-       service: an authorized google service
        sftp: a connected paramiko SFTPClient
        remote_file_path: the remote file path to the file for potential uploading
-       drive_folder_id: the id of the target folder on the google drive
+       attrs: the file's attributes from the sftp
+       folder: the target folder on the google drive, its listing is updated with the uploaded file
+       manifest: the record of backed up files and upload sessions
+
+    returns:
+        the result for `Progress.update()` and a message to print, if any
     """
+    service = services.drive()
+    drive_files = folder.files(service)
     remote_file = os.path.basename(remote_file_path)  # noqa: PTH119 | paramiko is not compatible with Path
+    remote_file_mtime = remote_mtime(attrs)
 
-    st_mtime = sftp.lstat(remote_file_path).st_mtime
-    remote_file_mtime = datetime.fromtimestamp(float(st_mtime)).astimezone(tz=ZoneInfo('UTC')) if isinstance(st_mtime, int) else datetime(year=2001, month=1, day=1, tzinfo=ZoneInfo('UTC'))
-    delete_prev_line = False
+    drive_file = drive_files.get(remote_file)
+    if drive_file:
+        drive_file_modified_time = datetime.fromisoformat(drive_file['modifiedTime'])
+        if remote_file_mtime <= drive_file_modified_time:
+            return 'unchanged', None
+        if drive_file.get('size') == str(attrs.st_size) and drive_file.get('md5Checksum') == remote_md5(sftp, remote_file_path):
+            return 'unchanged', None
 
-    if (datetime.now(tz=ZoneInfo('UTC')) - remote_file_mtime) <= timedelta(hours=args.age):
-        try:
-            results = service.files().list(q=f"name = '{remote_file}' and '{drive_folder_id}' in parents",
-                                        supportsAllDrives=True,
-                                        includeItemsFromAllDrives=True,
-                                        fields='files(id, modifiedTime)').execute()
-            files = results.get('files', [])
-            if files:
-                del_prev(delete_prev_line)
-                print(f'{remote_file} already exists on google drive')
-                delete_prev_line = True
-                drive_file_id = files[0]['id']
-                drive_file_modified_time = datetime.fromisoformat(files[0]['modifiedTime'])
-                if remote_file_mtime > drive_file_modified_time:
-                    del_prev(delete_prev_line)
-                    print(f'{remote_file} has been updated since uploading')
-                    print(f'updating {remote_file} on google drive...')
-                    delete_prev_line = True
-                    with sftp.file(remote_file_path, 'rb') as remote_file_content:
-                        remote_file_content.prefetch()
-                        media = MediaIoBaseUpload(remote_file_content, mimetype='application/octet-stream', chunksize=1024 * 1024, resumable=True)
-                        service.files().update(fileId=drive_file_id, media_body=media, supportsAllDrives=True).execute()
-                        del_prev(delete_prev_line)
-                        print(f'{remote_file} updated on google drive.')
-                        delete_prev_line = False
-                else:
-                    del_prev(delete_prev_line)
-                    print(f'{remote_file} has not been updated, skipping...')
-                    delete_prev_line = True
-            else:
-                del_prev(delete_prev_line)
-                print(f'uploading {remote_file} to google drive...')
-                delete_prev_line = True
-                with sftp.file(remote_file_path, 'rb') as remote_file_content:
-                    remote_file_content.prefetch()
-                    media = MediaIoBaseUpload(remote_file_content, mimetype='application/octet-stream', chunksize=1024 * 1024, resumable=True)
-                    file_metadata = {
-                        'name': remote_file,
-                        'parents': [drive_folder_id],
-                    }
-                    service.files().create(supportsAllDrives=True, media_body=media, body=file_metadata).execute()
-                    del_prev(delete_prev_line)
-                    print(f'{remote_file} uploaded to google drive.')
-                    delete_prev_line = False
+    with sftp.file(remote_file_path, 'rb') as remote_file_content:
+        remote_file_content.prefetch()
+        media = MediaIoBaseUpload(remote_file_content, mimetype='application/octet-stream', chunksize=CHUNK_SIZE, resumable=True)
+        if drive_file:
+            request = service.files().update(fileId=drive_file['id'], media_body=media, supportsAllDrives=True, fields=DRIVE_FILE_FIELDS)
+        else:
+            file_metadata = {
+                'name': remote_file,
+                'parents': [folder.id],
+            }
+            request = service.files().create(supportsAllDrives=True, media_body=media, body=file_metadata, fields=DRIVE_FILE_FIELDS)
+        drive_files[remote_file] = resumable_upload(request, manifest, remote_file_path, attrs)
 
-        except HttpError as error:
-            sys.exit(f'error checking google drive: {error}')
-    else:
-        del_prev(delete_prev_line)
-        print(f'{remote_file} is {round((datetime.now(tz=ZoneInfo('UTC')) - remote_file_mtime).total_seconds() / 60 / 60, 2)} hours old, skipping...')
-        delete_prev_line = True
+    if drive_file:
+        return 'updated', f'{remote_file_path} updated on google drive'
+    return 'uploaded', f'{remote_file_path} uploaded to google drive'
 
-    del_prev(delete_prev_line)
 
+def list_folder(service, folder_id: str) -> dict[str, dict]:  # noqa: ANN001 | service is dynamically typed
+    """
+    lists every file in a google drive folder, one page of up to 1000 files per request
 
-def find_or_create_folder(service, folder_name: str, parent_folder_id: str) -> str:  # noqa: ANN001 | service is dynamically typed
+    args:
+        service: an authorized google drive service
+        folder_id: the id of the folder on the google drive
+
+    returns:
+        the folder's files keyed by name, with the fields in `DRIVE_FILE_FIELDS`
+    """
+    drive_files = {}
+    page_token = None
+    while True:
+        results = service.files().list(q=f"'{folder_id}' in parents",
+                                       supportsAllDrives=True,
+                                       includeItemsFromAllDrives=True,
+                                       pageSize=1000,
+                                       pageToken=page_token,
+                                       fields=f'nextPageToken, files({DRIVE_FILE_FIELDS})').execute()
+        for drive_file in results.get('files', []):
+            drive_files.setdefault(drive_file['name'], drive_file)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return drive_files
+
+
+def find_or_create_folder(service, folder_name: str, parent: DriveFolder) -> DriveFolder:  # noqa: ANN001 | service is dynamically typed
     """
     finds or creates the specified folder on the google drive
 
     args:
         service: an authorized google drive service
         folder_name: the folder name
-        parent_folder_id: the id of the parent folder on the google drive
+        parent: the parent folder on the google drive, its listing is updated if the folder is created
 
     returns:
-        the folder id of the target folder
+        the target folder
     """
     try:
-        results = service.files().list(q=f"name = '{folder_name}' and '{parent_folder_id}' in parents",
-                                       supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-        files = results.get('files', [])
-        if not files:
-            file_metadata = {
-                'name': folder_name,
-                'parents': [parent_folder_id],
-                'mimeType': 'application/vnd.google-apps.folder',
-            }
-            folder = service.files().create(supportsAllDrives=True, body=file_metadata).execute()
-            return folder['id']
-        return files[0]['id']
+        parent_files = parent.files(service)
+        if folder_name in parent_files:
+            return DriveFolder(parent_files[folder_name]['id'])
+        file_metadata = {
+            'name': folder_name,
+            'parents': [parent.id],
+            'mimeType': 'application/vnd.google-apps.folder',
+        }
+        folder = service.files().create(supportsAllDrives=True, body=file_metadata, fields=DRIVE_FILE_FIELDS).execute()
+        parent_files[folder_name] = folder
+        # a folder created this run is known to be empty, so it does not need to be listed
+        return DriveFolder(folder['id'], {})
 
     except HttpError as error:
         sys.exit(f'error checking google drive: {error}')
 
 
-def upload_directory(service, sftp: paramiko.SFTPClient, remote_path: str, drive_folder_id: str) -> None:  # noqa: ANN001 | service is dynamically typed
+def walk(transport: paramiko.Transport, remote_path: str, workers: int) -> Iterator[tuple[str, paramiko.SFTPAttributes]]:
+    """
+    walks an sftp tree with one listdir_attr per directory, listing directories concurrently on their own sftp channels
+    entries are yielded as soon as their directory is listed, so they can be acted on before the whole tree is walked
+    a directory is always yielded before its contents
+
+    args:
+        transport: the connected paramiko Transport
+        remote_path: the remote path to the root directory, ending with '/'
+        workers: the max number of directories to list at once
+
+    yields:
+        the remote path and attributes of each entry in the tree, with directory paths ending in '/'
+    """
+    channels = Channels(transport)
+    entries = queue.Queue()
+    listed = object()
+
+    def list_dir(dir_path: str) -> None:
+        try:
+            listing = channels.get().listdir_attr(dir_path)
+        except (OSError, paramiko.SSHException) as error:
+            entries.put(error)
+            listing = []
+        for attrs in listing:
+            item_path = dir_path + attrs.filename
+            is_dir = isinstance(attrs.st_mode, int) and stat.S_ISDIR(attrs.st_mode)
+            if is_dir:
+                item_path += '/'
+            entries.put((item_path, attrs))
+            if is_dir:
+                executor.submit(list_dir, item_path)
+        entries.put(listed)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='walk')
+    try:
+        # each directory is put on the queue before its listing is submitted, so the count only reaches 0 once the walk is done
+        unlisted = 1
+        executor.submit(list_dir, remote_path)
+        while unlisted:
+            entry = entries.get()
+            if entry is listed:
+                unlisted -= 1
+            elif isinstance(entry, Exception):
+                raise entry
+            else:
+                if entry[0].endswith('/'):
+                    unlisted += 1
+                yield entry
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        channels.close()
+
+
+def upload_directory(remote_path: str, folder: DriveFolder, scheduler: TransferScheduler, max_age: timedelta | None, walkers: int) -> None:
     """
     upload an entire directory from an sftp to the google drive as needed
+    the tree is walked with `walk()` and each file that needs checking is queued on the scheduler as soon as its directory is listed
+    files that match the manifest are skipped without any google drive calls, and a drive folder is only listed if a file in it needs checking
+    the tree is walked on the scheduler's transport and folders are created with this thread's drive service
 
     args:
-        service: an authorized google drive service
-        sftp: a connected paramiko SFTPClient
-        remote_path: the remote path to the directory
-        drive_folder_id: the id for the target google drive folder
-    """
-    sftp.chdir(remote_path)
-    print(f'checking {remote_path}...')
-    for item in sftp.listdir():
-        remote_item_path = remote_path + item
-        mode = sftp.lstat(remote_item_path).st_mode
+        remote_path: the remote path to the directory, ending with '/'
+        folder: the target folder on the google drive
+        scheduler: the scheduler to queue file transfers on
+        max_age: files not in the manifest with an mtime older than this are not checked; None to reconcile every file
+        walkers: the max number of directories to list at once
+    """
+    service = services.drive()
+    manifest = scheduler.manifest
+    folders = {remote_path: folder}
+    scheduler.progress.log(f'checking {remote_path}...')
+    for remote_item_path, attrs in walk(scheduler.transport, remote_path, walkers):
+        mode = attrs.st_mode
         if not isinstance(mode, int):
             sys.exit(f'could not get mode for {remote_item_path} on sftp')
+        parent = folders[remote_item_path.removesuffix('/').rpartition('/')[0] + '/']
         if stat.S_ISREG(mode):
-            upload_file(service, sftp, remote_item_path, drive_folder_id)
+            if max_age is not None and manifest.unchanged(remote_item_path, attrs):
+                scheduler.progress.update('unchanged')
+            elif max_age is not None and (datetime.now(tz=ZoneInfo('UTC')) - remote_mtime(attrs)) > max_age:
+                scheduler.progress.update('too old')
+            else:
+                scheduler.submit(remote_item_path, attrs, parent)
         elif stat.S_ISDIR(mode):
-            subfolder_name = item
-            subfolder_drive_folder_id = find_or_create_folder(service, subfolder_name, drive_folder_id)
-            upload_directory(service, sftp, remote_item_path + '/', subfolder_drive_folder_id)
+            scheduler.progress.log(f'checking {remote_item_path}...')
+            subfolder_id = manifest.folder(remote_item_path) if max_age is not None else None
+            if subfolder_id is None:
+                subfolder = find_or_create_folder(service, attrs.filename, parent)
+                manifest.record_folder(remote_item_path, subfolder.id)
+            else:
+                subfolder = DriveFolder(subfolder_id)
+            folders[remote_item_path] = subfolder
 
 
 if __name__ == '__main__':
@@ -159,6 +690,9 @@ if __name__ == '__main__':
     group.add_argument('-v', '--vendor', action='store_true', help='backup vendor sftp')
     group.add_argument('-p', '--pmp', action='store_true', help='backup pmp sftp')
     parser.add_argument('-a', '--age', type=int, default=24, help='max file age in hours on sftp to check for backing up')
+    parser.add_argument('-w', '--workers', type=int, default=6, help='max number of files to transfer at once (default: %(default)s)')
+    parser.add_argument('-l', '--listers', type=int, default=2, help='max number of sftp directories to list at once (default: %(default)s)')
+    parser.add_argument('-f', '--full', action='store_true', help='check every file against the google drive regardless of age or the manifest, only uploading files that differ')
 
     args = parser.parse_args()
     load_dotenv()
@@ -181,25 +715,26 @@ if __name__ == '__main__':
     else:
         sys.exit('we should never be here')
 
-    creds = auth.auth()
-    service = build('drive', 'v3', credentials=creds)
-
     ssh = paramiko.SSHClient()
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     ssh.connect(hostname=sftp_host, port=int(sftp_port), username=sftp_user, password=sftp_password)
-    sftp = ssh.open_sftp()
     try:
         vendor = "vendor" if args.vendor else "pmp"
         print(f'updating {vendor} sftp backup...\n')
-        upload_directory(service, sftp, remote_path, drive_folder_id)
+        transport = ssh.get_transport()
+        if transport is None:
+            sys.exit('ssh is not connected')
+        max_age = None if args.full else timedelta(hours=args.age)
+        with Manifest(CACHE_DIR / f'sftp_backup_{vendor}.sqlite') as manifest, TransferScheduler(transport, args.workers, manifest) as scheduler:
+            upload_directory(remote_path, DriveFolder(drive_folder_id), scheduler, max_age, args.listers)
+        progress = scheduler.progress
     finally:
         print()
-        if sftp:
-            sftp.close()
-            print('sftp closed')
         if ssh:
             ssh.close()
             print('ssh closed')
         print()
 
+    if progress.counts['failed']:
+        sys.exit(f'{vendor} sftp backup finished with {progress.counts['failed']} failed files')
     print(f'{vendor} sftp backup complete')
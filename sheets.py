@@ -0,0 +1,133 @@
+from collections.abc import Mapping
+from datetime import datetime
+
+import polars as pl
+
+import services
+
+SERIAL_EPOCH = datetime(1899, 12, 30)  # noqa: DTZ001 | day 0 of google sheets serial dates, which have no time zone
+MS_PER_DAY = 86_400_000
+
+type ColumnTypes = Mapping[str, pl.DataType | type[pl.DataType] | None]
+
+
+def _a1_sheet(sheet_name: str) -> str:
+    """
+    args:
+        sheet_name: the name of a sheet
+
+    returns:
+        the sheet name quoted for use in an a1 range
+    """
+    return f"'{sheet_name.replace("'", "''")}'"
+
+
+def _column_letter(index: int) -> str:
+    """
+    args:
+        index: a zero based column index
+
+    returns:
+        the a1 letters of the column, eg: 0 -> 'A', 27 -> 'AB'
+    """
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def _typed(name: str, raw_dtype: pl.DataType, dtype: pl.DataType | type[pl.DataType] | None) -> pl.Expr:
+    """
+    types a column read with `UNFORMATTED_VALUE`, where blank cells are empty strings and dates are serial numbers
+
+    args:
+        name: the name of the column
+        raw_dtype: the type polars inferred for the column
+        dtype: the type of the column, or None to keep the inferred type
+
+    returns:
+        an expression for the typed column
+    """
+    col = pl.col(name)
+    if raw_dtype == pl.String:
+        col = col.replace('', None)
+    if dtype is None:
+        return col
+    if dtype.base_type() in {pl.Date, pl.Datetime}:  # base_type() so parameterized datetimes, eg: pl.Datetime('ms'), match too
+        millis = (col.cast(pl.Float64) * MS_PER_DAY).round().cast(pl.Int64)
+        col = pl.lit(SERIAL_EPOCH) + pl.duration(milliseconds=millis)
+    return col.cast(dtype).alias(name)
+
+
+def read_sheets(spreadsheet_id: str, columns: Mapping[str, ColumnTypes], *, header_row: int = 1) -> dict[str, pl.DataFrame]:
+    """
+    reads only the requested columns of one or more sheets in a google sheet with two `values.batchGet` requests,
+    one for the header rows and one for the columns, instead of exporting and parsing the whole workbook
+    values are read with `UNFORMATTED_VALUE` by column and each column is built straight into a polars series,
+    blank cells are null, and date and datetime columns are converted from sheets serial numbers
+
+    args:
+        spreadsheet_id: the id of the google sheet
+        columns: the columns to read from each sheet, keyed by sheet name, with the type of each column or None to infer it
+        header_row: the row with the column names, the values are read from every row below it
+
+    returns:
+        a dataframe for each sheet, keyed by sheet name, with the columns in the requested order
+
+    raises:
+        ValueError: a requested column is not in the header row of its sheet
+    """
+    values = services.sheets().spreadsheets().values()
+    headers = values.batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=[f'{_a1_sheet(sheet_name)}!{header_row}:{header_row}' for sheet_name in columns],
+        majorDimension='ROWS',
+    ).execute()['valueRanges']
+
+    ranges = []
+    for (sheet_name, sheet_columns), header in zip(columns.items(), headers, strict=True):
+        header_values = [str(name).strip() for name in header.get('values', [[]])[0]]
+        for name in sheet_columns:
+            if name not in header_values:
+                msg = f'{name} not found in the header of {sheet_name}'
+                raise ValueError(msg)
+            letter = _column_letter(header_values.index(name))
+            ranges.append(f'{_a1_sheet(sheet_name)}!{letter}{header_row + 1}:{letter}')
+
+    value_ranges = iter(values.batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=ranges,
+        majorDimension='COLUMNS',
+        valueRenderOption='UNFORMATTED_VALUE',
+        dateTimeRenderOption='SERIAL_NUMBER',
+    ).execute()['valueRanges'])
+
+    frames = {}
+    for sheet_name, sheet_columns in columns.items():
+        raw = [pl.Series(name, next(value_ranges).get('values', [[]])[0], strict=False) for name in sheet_columns]
+        height = max((series.len() for series in raw), default=0)  # trailing blank cells are not returned, so columns can be shorter than the sheet
+        frames[sheet_name] = (
+            pl.DataFrame([series.extend_constant(None, height - series.len()) for series in raw])
+            .select(
+                _typed(series.name, series.dtype, dtype) for series, dtype in zip(raw, sheet_columns.values(), strict=True)
+            )
+        )
+    return frames
+
+
+def read_sheet(spreadsheet_id: str, sheet_name: str, columns: ColumnTypes, *, header_row: int = 1) -> pl.DataFrame:
+    """
+    reads only the requested columns of a sheet, see `read_sheets()`
+
+    args:
+        spreadsheet_id: the id of the google sheet
+        sheet_name: the name of the sheet
+        columns: the columns to read, with the type of each column or None to infer it
+        header_row: the row with the column names, the values are read from every row below it
+
+    returns:
+        a dataframe with the columns in the requested order
+    """
+    return read_sheets(spreadsheet_id, {sheet_name: columns}, header_row=header_row)[sheet_name]
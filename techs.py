@@ -4,10 +4,10 @@ from pathlib import Path
 
 import pandas as pd
 import polars as pl
-from az_pmp_utils import auth, email, files
+from az_pmp_utils import email, files
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 
+import services
 from constants import PHX_TZ
 
 last_mo = datetime.now(tz=PHX_TZ).date().replace(day=1) - timedelta(days=1)
@@ -73,8 +73,7 @@ data.insert(0, s_to_t.columns)
 
 sheet_name = f'{last_mo.year}{str(last_mo.month).zfill(2)}'
 
-creds = auth.auth()
-service = build('sheets', 'v4', credentials=creds)
+service = services.sheets()
 
 print('adding sheet...')
 service.spreadsheets().batchUpdate(
@@ -99,4 +98,4 @@ email_body = f'hi all,\n\nthe superseded to tech sheet has been updated to inclu
 subject = f'{last_mo.month}/{last_mo.year} superseded to tech update'
 message = email.EmailMessage(sender=sender, to=to, subject=subject, message_text=email_body, monospace=True)
 
-email.send_email(message)
+email.send_email(message, service=services.gmail())
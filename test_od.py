@@ -0,0 +1,28 @@
+from datetime import date
+
+import polars as pl
+
+from od import match_decedents
+
+
+def test_match_decedents_keeps_each_decedent_to_their_own_window() -> None:
+    """decedents sharing a dob are pulled together, but each should only match dispensations in their own dod window"""
+    dob = date(1980, 1, 1)
+    ods = pl.DataFrame({
+        'DOB': [dob, dob],
+        'DOD': [date(2024, 3, 1), date(2024, 9, 1)],
+        'full_name': ['JANE DOE', 'JANE DOE'],
+    })
+    data = pl.DataFrame({
+        'Day of Patient Birthdate': [dob, dob],
+        'Day of Filled At': [date(2024, 2, 15), date(2024, 8, 15)],
+        'orig_patient_name': ['JANE DOE', 'JANE DOE'],
+        'Generic Name': ['march fill', 'august fill'],
+    })
+
+    matched = match_decedents(ods, data, days_before=30, ratio=0.8)
+
+    assert matched.select('DOD', 'Generic Name').rows() == [
+        (date(2024, 3, 1), 'march fill'),
+        (date(2024, 9, 1), 'august fill'),
+    ]
@@ -2,19 +2,13 @@ import os
 import sys
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import TYPE_CHECKING
 
 import polars as pl
-from az_pmp_utils import auth
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 
+import services
 from constants import PHX_TZ
 
-if TYPE_CHECKING:
-    import google.auth.external_account_authorized_user
-    import google.oauth2.credentials
-
 
 @dataclass
 class ThresholdInfo:
@@ -75,17 +69,16 @@ def threshold_report(patient_number: int) -> ThresholdInfo:
     return ThresholdInfo(date_str, patient_number, success, failed_to_send.height, perc)
 
 
-def update_sheet(creds: google.oauth2.credentials.Credentials | google.auth.external_account_authorized_user.Credentials, thresh: ThresholdInfo, file_id: str) -> None:
+def update_sheet(thresh: ThresholdInfo, file_id: str) -> None:
     """
     updates the threshold google sheet with the '3x3' list
 
     args:
-        creds: credentials from `auth.auth()`
         thresh: the `ThresholdInfo` returned by `threshold_report()`
         file_id: the google drive file id of the 3x3 threshold sheet
     """
     range_name = '3x3!A:A'
-    service = build('sheets', 'v4', credentials=creds)
+    service = services.sheets()
     result = service.spreadsheets().values().get(spreadsheetId=file_id, range=range_name).execute()
     values = result.get('values', [])
     last_row = len(values) if values else 1
@@ -108,6 +101,5 @@ if __name__ == '__main__':
         load_dotenv()
         threshold_sheet_id = os.environ['THRESHOLD_SHEET_FILE']
 
-        creds = auth.auth()
         thresh = threshold_report(int(sys.argv[1]))
-        update_sheet(creds, thresh, threshold_sheet_id)
+        update_sheet(thresh, threshold_sheet_id)
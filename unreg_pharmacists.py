@@ -1,19 +1,13 @@
 import os
 from datetime import datetime, timedelta
-from pathlib import Path
-from typing import TYPE_CHECKING
 
 import polars as pl
-from az_pmp_utils import auth, drive, files
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 
+import cache
+import services
 from constants import PHX_TZ
 
-if TYPE_CHECKING:
-    import google.auth.external_account_authorized_user
-    import google.oauth2.credentials
-
 
 def check_registration(service) -> pl.LazyFrame:    # noqa: ANN001 | service is dynamically typed
     """
@@ -26,7 +20,7 @@ def check_registration(service) -> pl.LazyFrame:    # noqa: ANN001 | service is
         a lazyframe with information ready to update the unreg pharmacist tracking sheet
     """
     awarxe_license_numbers = (
-        drive.awarxe(service=service)
+        cache.awarxe(service=service)
         .select(
             pl.col('professional license number').str.strip_chars().str.to_uppercase()
         )
@@ -35,10 +29,8 @@ def check_registration(service) -> pl.LazyFrame:    # noqa: ANN001 | service is
         .to_list()
     )
 
-    mp_path = Path('data/pharmacies.csv')
-    files.warn_file_age(mp_path)
     mp_deas = (
-        pl.scan_csv(mp_path, infer_schema=False)
+        cache.manage_pharmacies()
         .select(
             pl.col('DEA').alias('dea_number')
         )
@@ -47,10 +39,8 @@ def check_registration(service) -> pl.LazyFrame:    # noqa: ANN001 | service is
         .to_list()
     )
 
-    lr_path = Path('data/List Request.csv')
-    files.warn_file_age(lr_path)
     list_request = (
-        pl.scan_csv(lr_path, infer_schema=False)
+        cache.list_request()
         .with_columns(
             pl.concat_str(
                 [
@@ -71,7 +61,7 @@ def check_registration(service) -> pl.LazyFrame:    # noqa: ANN001 | service is
     list_request_bus = (
         list_request
         .select(
-            pl.col('License/Permit #').str.strip_chars().str.to_uppercase().alias('permit_number'),
+            pl.col('License/Permit #').alias('permit_number'),
             pl.col('Status').alias('igov_status'),
             pl.col('Business Name').alias('business_name'),
             pl.col('SubType').alias('subtype'),
@@ -82,7 +72,7 @@ def check_registration(service) -> pl.LazyFrame:    # noqa: ANN001 | service is
     list_request_per = (
         list_request
         .select(
-            pl.col('License/Permit #').str.strip_chars().str.to_uppercase().alias('license_number'),
+            pl.col('License/Permit #').alias('license_number'),
             pl.col('Email').alias('email'),
             pl.col('Street Address').alias('address'),
             pl.concat_str(
@@ -106,7 +96,7 @@ def check_registration(service) -> pl.LazyFrame:    # noqa: ANN001 | service is
     license_tracker_file_id = os.environ['PI_LICENSE_TRACKER_FILE']
 
     inspect_pharmacists = (
-        drive.lazyframe_from_id_and_sheetname(file_id=license_tracker_file_id, sheet_name='Form Responses 1', service=service, infer_schema_length=0)  # read_excel() does not have infer_schema
+        cache.sheet(license_tracker_file_id, 'Form Responses 1', infer_schema_length=0)  # read_excel() does not have infer_schema
         .select(
             pl.col('Timestamp').str.to_date('%Y-%m-%d %H:%M:%S%.f').alias('submit_date'),
             pl.col('Permit Number').alias('permit_number'),
@@ -152,17 +142,16 @@ def check_registration(service) -> pl.LazyFrame:    # noqa: ANN001 | service is
     )
 
 
-def update_unreg_sheet(creds: google.oauth2.credentials.Credentials | google.auth.external_account_authorized_user.Credentials, unregistered_pharmacists: pl.DataFrame) -> None:
+def update_unreg_sheet(unregistered_pharmacists: pl.DataFrame) -> None:
     """
     update the unregistered pharmacists sheet with new unregistered pharmacists
 
     args:
-        creds: google drive credentials from `auth.auth()`
         unregistered_pharmacists: a LazyFrame with the unregistered pharmacists submitted with pharmacy inspections in the last month
     """
     sheet_id = os.environ['UNREG_PHARMACISTS_FILE']
     range_name = 'pharmacists!B:B'
-    service = build('sheets', 'v4', credentials=creds)
+    service = services.sheets()
     result = service.spreadsheets().values().get(spreadsheetId=sheet_id, range=range_name).execute()
     values = result.get('values', [])
 
@@ -211,8 +200,7 @@ def update_unreg_sheet(creds: google.oauth2.credentials.Credentials | google.aut
 if __name__ == '__main__':
     load_dotenv()
 
-    creds = auth.auth()
-    service = build('drive', 'v3', credentials=creds)
+    service = services.drive()
 
     unreg_pharmacists = check_registration(service)
-    update_unreg_sheet(creds, unreg_pharmacists.collect())
+    update_unreg_sheet(unreg_pharmacists.collect())
@@ -8,18 +8,17 @@ from typing import TYPE_CHECKING, Literal
 
 import polars as pl
 import pymupdf
-from az_pmp_utils import auth, deas, drive, email
+from az_pmp_utils import drive, email
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 
-from constants import PHX_TZ
+import cache
+import mailer
+import services
+from constants import MAIL_CHECKPOINT_DIR, PHX_TZ
 
 if TYPE_CHECKING:
     from io import BytesIO
 
-    import google.auth.external_account_authorized_user
-    import google.oauth2.credentials
-
 
 # ruff: noqa: PLC1901
 # polars cols with empty string are not falsey
@@ -58,18 +57,15 @@ class BoardInfo:
     board_df: pl.DataFrame = field(default_factory=pl.DataFrame)
 
 
-def get_board_contacts(service) -> dict:    # noqa: ANN001 | service is dynamically typed
+def get_board_contacts() -> dict:
     """
     pulls board names and emails from the `BOARD_CONTACTS_FILE`
 
-    args:
-        service: a google drive service
-
     returns:
         a dictionary with a board name as the key and BoardInfo (with default uploads_folder, cleaned_license_expr, and board_df) as the value
     """
     contacts_file = os.environ['BOARD_CONTACTS_FILE']
-    board_contacts = drive.lazyframe_from_id_and_sheetname(service=service, file_id=contacts_file, sheet_name='registration', infer_schema_length=0).collect()  # read_excel does not have infer_schema
+    board_contacts = cache.sheet(contacts_file, 'registration', infer_schema_length=0).collect()  # read_excel does not have infer_schema
     boards = board_contacts['Board'].to_list()
     boards_dict = {}
     for board in boards:
@@ -94,7 +90,7 @@ def check_deas_for_registration(service) -> pl.LazyFrame:   # noqa: ANN001 | ser
         a `LazyFrame` with unregistered DEAs
     """
     awarxe = (
-        drive
+        cache
         .awarxe(service=service)
         .collect()
         .drop_nulls('dea number')
@@ -109,8 +105,7 @@ def check_deas_for_registration(service) -> pl.LazyFrame:   # noqa: ANN001 | ser
 
     today = datetime.now(tz=PHX_TZ).date()
     az_presc = (
-        deas.deas('presc')
-        .with_columns(pl.col(['Date of Original Registration', 'Expiration Date']).str.to_date('%Y%m%d', strict=False))
+        cache.deas('presc')
         .filter(pl.col('Expiration Date') > today)
     )
     return (
@@ -124,12 +119,11 @@ def check_deas_for_registration(service) -> pl.LazyFrame:   # noqa: ANN001 | ser
     )
 
 
-def infer_board(service, unreg_deas: pl.LazyFrame) -> pl.LazyFrame:  # noqa: ANN001 | service is dynamically typed
+def infer_board(unreg_deas: pl.LazyFrame) -> pl.LazyFrame:
     """
     infer degrees and then board, prints the number of deas for which a board was unable to be inferred
 
     args:
-        service: a google drive service
         unreg_deas: a lazyframe of unregistered prescribers returned by `check_deas_for_registration()`
 
     returns:
@@ -138,9 +132,9 @@ def infer_board(service, unreg_deas: pl.LazyFrame) -> pl.LazyFrame:  # noqa: ANN
     ex_degs_file = os.environ['EXCLUDE_DEGS_FILE']
     deg_board_file = os.environ['DEG_BOARD_FILE']
 
-    exclude_degs = drive.lazyframe_from_id_and_sheetname(service=service, file_id=ex_degs_file, sheet_name='exclude_degs', infer_schema_length=0)  # read_excel does not have infer_schema
+    exclude_degs = cache.sheet(ex_degs_file, 'exclude_degs', infer_schema_length=0)  # read_excel does not have infer_schema
     deg_exclude = exclude_degs.collect()['deg'].to_list()
-    boards = drive.lazyframe_from_id_and_sheetname(service=service, file_id=deg_board_file, sheet_name='deg_board', infer_schema_length=0)  # read_excel does not have infer_schema
+    boards = cache.sheet(deg_board_file, 'deg_board', infer_schema_length=0)  # read_excel does not have infer_schema
 
     with_deg = unreg_deas.filter(pl.col('Degree').is_not_null() & (pl.col('Degree') != ''))
     without_deg = unreg_deas.filter(pl.col('Degree').is_null() | (pl.col('Degree') == ''))
@@ -330,13 +324,12 @@ def add_dfs_to_board_info(service, unreg_presc: pl.LazyFrame, board_info: dict)
     return board_info
 
 
-def send_emails(board_dict: dict[str, BoardInfo], creds: google.oauth2.credentials.Credentials | google.auth.external_account_authorized_user.Credentials, drive_service) -> None:    # noqa: ANN001 | service is dynamically typed
+def send_emails(board_dict: dict[str, BoardInfo], drive_service) -> None:    # noqa: ANN001 | service is dynamically typed
     """
     sends emails to each board with their unregistered prescribers
 
     args:
         board_dict: the `board_dict` returned by `add_dfs_to_board_info()`
-        creds: google api credentials
         drive_service: a google drive service
     """
     def remove_first_page(export: BytesIO, file_path: Path) -> None:
@@ -349,7 +342,7 @@ def send_emails(board_dict: dict[str, BoardInfo], creds: google.oauth2.credentia
 
     print('pulling RegistrationRequirementsNotice...')
     reg_req_notice = os.environ['UNREG_PRESCRIBERS_FILE']
-    docs_service = build('docs', 'v1', credentials=creds)
+    docs_service = services.docs()
 
     today_str = datetime.now(tz=PHX_TZ).date().strftime('%B %d, %Y')
 
@@ -385,11 +378,14 @@ def send_emails(board_dict: dict[str, BoardInfo], creds: google.oauth2.credentia
 
     signature = os.environ['EMAIL_COMP_SIG'].replace(r'\n', '\n')
 
+    messages = {}
+    report_files = []
     for board, info in board_dict.items():
         report_file = Path(f'{board}_unregistered_prescribers_{today_str}.csv')
         info.board_df.write_csv(report_file)
+        report_files.append(report_file)
 
-        message = email.EmailMessage(
+        messages[board] = email.EmailMessage(
             sender=os.environ['EMAIL_COMPLIANCE'],
             to=info.board_emails,
             subject=f'CSPMP Unregistered Prescribers {info.board_name}',
@@ -403,8 +399,10 @@ def send_emails(board_dict: dict[str, BoardInfo], creds: google.oauth2.credentia
             bcc=os.environ['EMAIL_COMPLIANCE']
         )
 
-        email.send_email(message, draft=(not args.send_email))
-        Path(report_file).unlink()
+    checkpoint = MAIL_CHECKPOINT_DIR / f'unreg_presc_{datetime.now(tz=PHX_TZ).date()}.jsonl'
+    mailer.send_all(messages, draft=(not args.send_email), checkpoint=checkpoint)
+    for report_file in report_files:
+        report_file.unlink()
 
 
 if __name__ == '__main__':
@@ -413,15 +411,15 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     load_dotenv()
-    creds = auth.auth()
-    service = build('drive', 'v3', credentials=creds)
+    service = services.drive()
+    cache.prefetch_modified_times([os.environ['BOARD_CONTACTS_FILE'], os.environ['EXCLUDE_DEGS_FILE'], os.environ['DEG_BOARD_FILE']])
 
     unreg_deas = check_deas_for_registration(service)
-    unregistered_w_boards = infer_board(service, unreg_deas)
-    board_contacts = get_board_contacts(service)
+    unregistered_w_boards = infer_board(unreg_deas)
+    board_contacts = get_board_contacts()
     board_info = update_board_info_with_uploaders(board_contacts)
     full_board_info = add_dfs_to_board_info(service, unregistered_w_boards, board_info)
-    send_emails(full_board_info, creds, service)
+    send_emails(full_board_info, service)
 
     # board_counts = full_board_info.board_df.collect()['board'].value_counts(sort=True)
     # print('board unregistered counts (written to clipboard):')